@@ -11,10 +11,11 @@ processing and data analysis tasks.
 """
 
 from ._version import __version__
-from .io.api import read, read_example, save, load, save_mat, load_mat
+from .io.api import read, read_example, read_mfdataset, save, load, save_mat, load_mat
 from .rotate.api import rotate2, calc_principal_heading, set_declination, set_inst2head_rotmat
 from .rotate.base import euler2orient, orient2euler, quaternion2orient
-from .velocity import VelBinner
+from .velocity import VelBinner, StreamingVelBinner
+from .tools.fft import set_fft_backend
 from dolfyn import adv
 from dolfyn import adp
 from dolfyn import time
@@ -34,7 +34,8 @@ def _diffz_centered_extended(dat, z):
 
 class ADPBinner(VelBinner):
     def __init__(self, n_bin, fs, n_fft=None, n_fft_coh=None,
-                 noise=None, orientation='up', diff_style='centered_extended'):
+                 noise=None, orientation='up', diff_style='centered_extended',
+                 dtype=None):
         """A class for calculating turbulence statistics from ADCP data
 
         Parameters
@@ -59,9 +60,12 @@ class ADPBinner(VelBinner):
             Either 'first' (first difference), 'centered' (centered difference),
             or 'centered_extended' (centered difference with first and last points
              extended using a first difference).
+        dtype : str or numpy.dtype (default: None)
+            The precision of the calculations, e.g. 'float32' for single
+            precision (see :class:`VelBinner <dolfyn.velocity.VelBinner>`).
         """
 
-        VelBinner.__init__(self, n_bin, fs, n_fft, n_fft_coh, noise)
+        VelBinner.__init__(self, n_bin, fs, n_fft, n_fft_coh, noise, dtype)
         self.diff_style = diff_style
         self.orientation = orientation
 
@@ -2,8 +2,9 @@
 """
 import numpy as np
 import warnings
-from ..velocity import VelBinner
-from ..tools.misc import group, slice1d_along_axis
+from numpy.lib.stride_tricks import sliding_window_view
+from ..binned import _block_size, _is_dask
+from ..tools.misc import group
 warnings.filterwarnings('ignore', category=np.RankWarning)
 
 sin = np.sin
@@ -52,6 +53,66 @@ def clean_fill(u, mask, npt=12, method='cubic', maxgap=6):
     return u
 
 
+def _nan_blocks(bds, npt):
+    """The (start, stop) indices of the blocks of `bds` to interpolate
+    over: the groups of bad points that are less than `npt` points apart,
+    with `npt` points on either side.
+    """
+    ibad = np.flatnonzero(bds)
+    if ibad.size == 0:
+        return np.zeros((0, 2), dtype=int)
+    # The first and last bad point of each group
+    split = np.flatnonzero(np.diff(ibad) > npt) + 1
+    first = ibad[np.concatenate([[0], split])]
+    last = ibad[np.concatenate([split - 1, [ibad.size - 1]])]
+    # A bad last point that starts its own group is not interpolated over
+    keep = first < len(bds) - 1
+    return np.stack([np.maximum(first[keep] - npt, 0),
+                     np.minimum(last[keep] + npt + 1, len(bds))], axis=-1)
+
+
+def _fill_mask(bds, maxgap):
+    """The bad points that are within the first `maxgap` points of their
+    gap (i.e. that `interpolate_na(..., limit=maxgap)` fills).
+    """
+    if maxgap is None:
+        return bds.copy()
+    i = np.arange(len(bds))
+    # The index of the start of the gap of each point
+    i_start = np.maximum.accumulate(np.where(bds, 0, i + 1))
+    return bds & (i - i_start < maxgap)
+
+
+def _interp_index(da):
+    """The coordinate of the last dimension of `da` as float (in ns since
+    1970 for times), as used by `interpolate_na`.
+    """
+    dim = da.dims[-1]
+    if dim not in da.coords:
+        return np.arange(da.shape[-1], dtype=np.float64)
+    x = da[dim].values
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    return x.astype(np.float64)
+
+
+def _interpolator(method, x, y):
+    """The function that interpolates between (`x`, `y`) with `method`,
+    as in `interpolate_na`, or None if it is not one of the methods of
+    `scipy.interpolate.interp1d`, 'pchip' or 'akima'.
+    """
+    from scipy import interpolate
+    if method in ['nearest', 'zero', 'slinear', 'quadratic', 'cubic']:
+        return interpolate.interp1d(x, y, kind=method, fill_value=np.nan,
+                                    bounds_error=False, assume_sorted=True,
+                                    copy=False)
+    if method == 'pchip':
+        return interpolate.PchipInterpolator(x, y)
+    if method == 'akima':
+        return interpolate.Akima1DInterpolator(x, y)
+    return None
+
+
 def _interp_nan(da, npt, method, maxgap):
     """Interpolate over the points in `bad` that are True.
 
@@ -71,62 +132,92 @@ def _interp_nan(da, npt, method, maxgap):
     -------
     da : xarray.DataArray
       The dataArray with nan's filled in
+
+    Notes
+    -----
+    Bad points that are less than `npt` points apart are interpolated
+    over together, using the good points of their block (which include
+    `npt` points on either side).
     """
 
-    searching = True
     bds = da.isnull().values
-    ntail = 0
-    pos = 0
-    # The index array:
-    i = np.arange(len(da), dtype=np.uint32)
-
-    while pos < len(da):
-        if searching:
-            # Check the point
-            if bds[pos]:
-                # If it's bad, mark the start
-                start = max(pos - npt, 0)
-                # And stop searching.
-                searching = False
-            pos += 1
-            # Continue...
-        else:
-            # Another bad point?
-            if bds[pos]:  # Yes
-                # Reset ntail
-                ntail = 0
-            else:  # No
-                # Add to the tail of the block.
-                ntail += 1
-            pos += 1
-
-            if (ntail == npt or pos == len(da)):
-                # This is the block we are interpolating over
-                i_int = i[start:pos]
-                da[i_int] = da[i_int].interpolate_na(dim=da.dims[-1],
-                                                     method=method,
-                                                     use_coordinate=True,
-                                                     limit=maxgap)
-                # Reset
-                searching = True
-                ntail = 0
+    blocks = _nan_blocks(bds, npt)
+    if not len(blocks):
+        return da
+    y = da.values
+    x = _interp_index(da)
+    fill = _fill_mask(bds, maxgap)
+    # Only the blocks with at least two good points are interpolated
+    n_good = np.concatenate([[0], np.cumsum(~bds)])
+    blocks = blocks[n_good[blocks[:, 1]] - n_good[blocks[:, 0]] >= 2]
+
+    if method == 'linear':
+        # Linear interpolation only uses the good points on either side
+        # of each gap, which are in its block, so that all blocks are
+        # interpolated at once.
+        in_block = np.zeros(len(y) + 1, dtype=int)
+        np.add.at(in_block, blocks[:, 0], 1)
+        np.add.at(in_block, blocks[:, 1], -1)
+        fill &= np.cumsum(in_block[:-1]) > 0
+        y[fill] = np.interp(x[fill], x[~bds], y[~bds],
+                            left=np.nan, right=np.nan)
+        da.values = y
+        return da
+
+    for start, stop in blocks:
+        slc = slice(start, stop)
+        good = ~bds[slc]
+        func = _interpolator(method, x[slc][good], y[slc][good])
+        if func is None:
+            da[slc] = da[slc].interpolate_na(dim=da.dims[-1],
+                                             method=method,
+                                             use_coordinate=True,
+                                             limit=maxgap)
+            continue
+        fl = fill[slc]
+        y[slc][fl] = func(x[slc][fl])
+    da.values = y
     return da
 
 
-def fill_nan_ensemble_mean(u, mask, fs, window):
+def _fill_bin_means(arr, n_bin):
+    """Replace the NaNs of `arr` (in place) with the mean of their bin of
+    `n_bin` points along the last axis (the last bin may be shorter).
+    """
+    n_full = (arr.shape[-1] // n_bin) * n_bin
+    # Views of the full bins, and of the extra points after them
+    bins = [arr[..., :n_full].reshape(arr.shape[:-1] + (-1, n_bin)),
+            arr[..., None, n_full:]]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for dat in bins:
+            if dat.size == 0:
+                continue
+            good = ~np.isnan(dat)
+            mean = (np.sum(dat, axis=-1, where=good, keepdims=True) /
+                    good.sum(-1, keepdims=True))
+            np.copyto(dat, mean, where=~good, casting='unsafe')
+    return arr
+
+
+def fill_nan_ensemble_mean(u, mask, fs, window, inplace=False):
     """Fill missing values with the ensemble mean.
 
     Parameters
     ----------
     u : xarray.DataArray (..., time)
-      The dataArray to clean. Can be 1D or 2D.
+      The dataArray to clean.
     mask : bool
       Logical tensor of elements to "nan" out (from `spikeThresh`, `rangeLimit`,
       or `GN2002`) and replace
     fs : int
       Instrument sampling frequency
     window : int
-      Size of window in seconds used to calculate ensemble means
+      Size of window in seconds used to calculate ensemble means. The
+      number of points in each window, `window` * `fs`, must be an
+      integer.
+    inplace : bool (default: False)
+      Whether to fill the values of `u` in place, rather than those of a
+      copy of `u`. Ignored for dask arrays.
 
     Returns
     -------
@@ -136,52 +227,39 @@ def fill_nan_ensemble_mean(u, mask, fs, window):
     Notes
     -----
     Gaps larger than the ensemble size will not get filled in.
-    """
-
-    u = u.where(~mask)
-    bnr = VelBinner(n_bin=window*fs, fs=fs)
 
-    if len(u.shape) == 1:
-        var = u.values[None, :]
-    else:
-        var = u.values
-
-    vel = np.empty(var.shape)
-    vel_reshaped = bnr.reshape(var)
-    vel_mean = np.nanmean(vel_reshaped, axis=-1)
-
-    # If there are extra datapoints trimmed off after the last ensemble,
-    # take them into account by filling in another ensemble with means
-    diff = vel.shape[-1] - vel_reshaped.size // vel.shape[0]
-    # diff = number of extra points
-    extra_nans = vel_reshaped.shape[-1] - diff
-    if diff:
-        vel = np.empty((var.shape[0], var.shape[-1]+extra_nans))
-        extra = var[:, -diff:]
-        empty = np.empty((vel.shape[0], extra_nans))*np.nan
-        extra = np.concatenate((extra, empty), axis=-1)
-        vel_reshaped = np.concatenate(
-            (vel_reshaped, extra[:, None, :]), axis=1)
-        extra_mean = np.nanmean(extra, axis=-1)
-        vel_mean = np.concatenate((vel_mean, extra_mean[:, None]), axis=-1)
-
-    # Create a matrix the same size as the reshaped array, and mask out the
-    # non-missing values. Then add the two matrices together.
-    vel_mean_matrix = np.tile(vel_mean[..., None], (1, 1, bnr.n_bin))
-    vel_missing = np.isnan(vel_reshaped)
-    vel_mask = np.ma.masked_array(vel_mean_matrix, ~vel_missing).filled(np.nan)
-    vel_filled = np.where(np.isnan(vel_reshaped), vel_mask,
-                          vel_reshaped + np.nan_to_num(vel_mask))
-    # "Unshape" the data
-    for i in range(var.shape[0]):
-        vel[i] = np.ravel(vel_filled[i], 'C')
-
-    if diff:  # Trim off the extra means
-        u.values = np.squeeze(vel[:, :-extra_nans])
-    else:
-        u.values = np.squeeze(vel)
+    Dask-backed (chunked) arrays are filled lazily, one bin-aligned chunk
+    at a time.
+    """
 
-    return u
+    n_bin = int(round(window * fs))
+    if n_bin < 1 or not np.isclose(window * fs, n_bin, rtol=0, atol=1e-6):
+        raise ValueError("`window` * `fs` ({}) must be a positive integer "
+                         "number of points.".format(window * fs))
+    mask = np.asarray(mask) if not _is_dask(mask) else mask
+
+    if _is_dask(u.data):
+        import dask.array as da
+        dat = da.where(mask, np.nan, u.data)
+        # Chunks of whole bins
+        n_chunk = max(dat.chunksize[-1] // n_bin, 1) * n_bin
+        dat = dat.rechunk({dat.ndim - 1: n_chunk})
+        dat = dat.map_blocks(lambda blk: _fill_bin_means(blk.copy(), n_bin),
+                             dtype=dat.dtype)
+        return u.copy(data=dat)
+
+    vals = u.values
+    if vals.dtype.kind != 'f':
+        vals = vals.astype(np.float64)
+    elif not inplace:
+        vals = vals.copy()
+    np.copyto(vals, np.nan, where=mask)
+    _fill_bin_means(vals, n_bin)
+
+    if inplace:
+        u.values = vals
+        return u
+    return u.copy(data=vals)
 
 
 def spike_thresh(u, thresh=10):
@@ -228,18 +306,21 @@ def range_limit(u, range=[-5, 5]):
 
 
 def _calcab(al, Lu_std_u, Lu_std_d2u):
-    """Solve equations 10 and 11 of Goring+Nikora2002
+    """Solve equations 10 and 11 of Goring+Nikora2002 (for arrays of
+    `al`, `Lu_std_u` and `Lu_std_d2u`)
     """
-
-    return tuple(np.linalg.solve(
-        np.array([[cos(al) ** 2, sin(al) ** 2],
-                  [sin(al) ** 2, cos(al) ** 2]]),
-        np.array([(Lu_std_u) ** 2, (Lu_std_d2u) ** 2])))
+    c2 = cos(al) ** 2
+    s2 = sin(al) ** 2
+    det = c2 ** 2 - s2 ** 2
+    return ((c2 * Lu_std_u ** 2 - s2 * Lu_std_d2u ** 2) / det,
+            (c2 * Lu_std_d2u ** 2 - s2 * Lu_std_u ** 2) / det)
 
 
 def _phaseSpaceThresh(u):
-    if u.ndim == 1:
-        u = u[:, None]
+    """Returns the mask of the points of `u` (shape (npt, n_windows))
+    that are outside of the phase-space ellipsoid of their window (i.e.
+    column).
+    """
     u = np.array(u)
     Lu = (2 * np.log(u.shape[0])) ** 0.5
     u = u - u.mean(0)
@@ -254,13 +335,9 @@ def _phaseSpaceThresh(u):
     std_du = np.std(du, axis=0)
     std_d2u = np.std(d2u, axis=0)
     alpha = np.arctan2(np.sum(u * d2u, axis=0), np.sum(u ** 2, axis=0))
-    a = np.empty_like(alpha)
-    b = np.empty_like(alpha)
-    with warnings.catch_warnings() as w:
-        warnings.filterwarnings(
-            'ignore', category=RuntimeWarning, message='invalid value encountered in ')
-        for idx, al in enumerate(alpha):
-            a[idx], b[idx] = _calcab(al, Lu * std_u[idx], Lu * std_d2u[idx])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a, b = _calcab(alpha, Lu * std_u, Lu * std_d2u)
+        # The ellipsoid radius in the direction of each point
         theta = np.arctan2(du, u)
         phi = np.arctan2((du ** 2 + u ** 2) ** 0.5, d2u)
         pe = (((sin(phi) * cos(theta) * cos(alpha) +
@@ -268,8 +345,36 @@ def _phaseSpaceThresh(u):
               ((sin(phi) * cos(theta) * sin(alpha) -
                 cos(phi) * cos(alpha)) ** 2) / b +
               ((sin(phi) * sin(theta)) ** 2) / (Lu * std_du) ** 2) ** -1
+    # All points (except those at the origin) of the windows where the
+    # ellipsoid is undefined (e.g. a std is 0) are outside of it
     pe[:, np.isnan(pe[0, :])] = 0
-    return (p > pe).flatten('F')
+    return p > pe
+
+
+def _good_regions(u, npt):
+    """The slices of the 1D `u` between its large (>npt/10) bad
+    (NaN) segments, if there are more than two of them.
+    """
+    ep = len(u)
+    # group returns a vector of slice objects.
+    bad_segs = group(np.isnan(u), min_length=int(npt//10))
+    if bad_segs.size <= 2:
+        return [slice(0, ep)]
+    # Break them up into separate regions:
+    sp = 0
+    # Skip start and end bad_segs:
+    if bad_segs[0].start == sp:
+        sp = bad_segs[0].stop
+        bad_segs = bad_segs[1:]
+    if bad_segs[-1].stop == ep:
+        ep = bad_segs[-1].start
+        bad_segs = bad_segs[:-1]
+    out = []
+    for bs in bad_segs:  # bs is a slice object.
+        out.append(slice(sp, bs.start))
+        sp = bs.stop
+    out.append(slice(sp, ep))
+    return out
 
 
 def GN2002(u, npt=5000):
@@ -288,57 +393,193 @@ def GN2002(u, npt=5000):
     -------
     mask : |np.ndarray|
       Logical vector with spikes labeled as 'True'
+
+    Notes
+    -----
+    Each good (i.e. between large NaN gaps) region of each component
+    is split into windows of `npt` points, and the last `npt` points of
+    the region. The windows of all the regions and components are
+    thresholded together.
     """
 
     if not isinstance(u, np.ndarray):
         return GN2002(u.values, npt=npt)
 
-    if u.ndim > 1:
-        mask = np.zeros(u.shape, dtype='bool')
-        for slc in slice1d_along_axis(u.shape, -1):
-            mask[slc] = GN2002(u[slc], npt=npt)
-        return mask
+    npt = int(npt)
+    u2 = u.reshape(-1, u.shape[-1])
+    mask = np.zeros(u2.shape, dtype='bool')
+    # The (component, start index) of each window of `npt` points, and
+    # whether it is the last window of its region:
+    rows, starts, last = [], [], []
+    for irow, row in enumerate(u2):
+        for reg in _good_regions(row, npt):
+            if reg.stop - reg.start < npt:
+                # Regions shorter than a window are thresholded alone
+                if reg.stop > reg.start:
+                    mask[irow, reg] = _phaseSpaceThresh(
+                        row[reg, None])[:, 0]
+                continue
+            nbins = (reg.stop - reg.start) // npt
+            rows += [irow] * (nbins + 1)
+            starts += list(reg.start + npt * np.arange(nbins))
+            starts.append(reg.stop - npt)
+            last += [False] * nbins + [True]
+    rows = np.array(rows, dtype=int)
+    starts = np.array(starts, dtype=int)
+    last = np.array(last, dtype=bool)
+    # The windows are the columns of the arrays passed to
+    # _phaseSpaceThresh, in blocks that limit its temporary arrays. The
+    # last window of each region overlaps the others, so it goes last.
+    n_blk = max(_block_size // npt, 1)
+    for wins in [~last, last]:
+        r_w, s_w = rows[wins], starts[wins]
+        for i0 in range(0, len(r_w), n_blk):
+            r = r_w[i0:i0 + n_blk, None]
+            inds = s_w[i0:i0 + n_blk, None] + np.arange(npt)
+            mask[r, inds] = _phaseSpaceThresh(u2[r, inds].T).T
+    return mask.reshape(u.shape)
+
+
+class StreamingGN2002():
+    """A sliding-window variant of :func:`GN2002` for data that arrives
+    in pieces (e.g. chunks of a record that is too large to despike at
+    once), which outputs the mask of the data as soon as it is known.
+
+    Parameters
+    ----------
+    npt : int (default: 5000)
+      The number of points of each window.
+    step : int (default: `npt` // 2)
+      The number of points between the start of consecutive (overlapping)
+      windows (`step` <= `npt`).
+
+    Examples
+    ========
+    Data is passed to the despiker with `push`, which returns the mask of
+    the data that precedes the last window (or part of a window) that it
+    has received::
+
+        despiker = avm.clean.StreamingGN2002(npt=5000)
+        mask = []
+        for chunk in chunks:
+            mask.append(despiker.push(chunk))
+        mask.append(despiker.flush())
+        mask = np.concatenate(mask, axis=-1)
 
-    mask = np.zeros(len(u), dtype='bool')
+    Notes
+    -----
+    Each point is despiked with the phase-space threshold of the window
+    in which it is most central: window `i` starts at point `i` * `step`,
+    and determines the mask of its central `step` points. The first
+    window also determines the mask of the points before them, and a
+    window of the last `npt` points (as in `GN2002`) that of the points
+    after the last full window, when the despiker is flushed.
+
+    Only the last `npt` points are kept in memory between calls to
+    `push`, and the windows of each chunk are thresholded in blocks,
+    so that the phase-space arrays of the whole chunk are never held in
+    memory at once.
+
+    Unlike `GN2002`, the data is not split at large gaps; no spikes are
+    found in windows that contain NaNs.
+    """
 
-    # Find large bad segments (>npt/10):
-    # group returns a vector of slice objects.
-    bad_segs = group(np.isnan(u), min_length=int(npt//10))
-    if bad_segs.size > 2:
-        # Break them up into separate regions:
-        sp = 0
-        ep = len(u)
-
-        # Skip start and end bad_segs:
-        if bad_segs[0].start == sp:
-            sp = bad_segs[0].stop
-            bad_segs = bad_segs[1:]
-        if bad_segs[-1].stop == ep:
-            ep = bad_segs[-1].start
-            bad_segs = bad_segs[:-1]
-
-        for ind in range(len(bad_segs)):
-            bs = bad_segs[ind]  # bs is a slice object.
-            # Clean the good region:
-            mask[sp:bs.start] = GN2002(u[sp:bs.start], npt=npt)
-            sp = bs.stop
-        # Clean the last good region.
-        mask[sp:ep] = GN2002(u[sp:ep], npt=npt)
-        return mask
-
-    c = 0
-    ntot = len(u)
-    nbins = int(ntot // npt)
-    mask_last = np.zeros_like(mask) + np.inf
-    mask[0] = True  # make sure we start.
-    while mask.any():
-        mask[:nbins * npt] = _phaseSpaceThresh(
-            np.array(np.reshape(u[:(nbins * npt)], (npt, nbins), order='F')))
-        mask[-npt:] = _phaseSpaceThresh(u[-npt:])
-        c += 1
-        if c >= 100:
-            raise Exception('GN2002 loop-limit exceeded.')
-        if mask.sum() >= mask_last.sum():
-            break
-        mask_last = mask.copy()
-    return mask
+    def __init__(self, npt=5000, step=None):
+        self.npt = int(npt)
+        if step is None:
+            step = self.npt // 2
+        self.step = int(step)
+        if not 0 < self.step <= self.npt:
+            raise ValueError("`step` must be between 1 and `npt`.")
+        self.reset()
+
+    def reset(self):
+        """Discard the buffered data, e.g. before pushing data that does
+        not follow on from the previous data.
+        """
+        self._buf = None
+        # The number of points received, and of points output
+        self._n_in = 0
+        self._n_out = 0
+        # The index of the first point of `_buf`, and of the next window
+        self._b0 = 0
+        self._iwin = 0
+
+    def push(self, u):
+        """Add the next chunk of data, of any length, to the despiker.
+
+        Parameters
+        ----------
+        u : xarray.DataArray or |np.ndarray|
+          The velocity data (1D or 3D, with time as the last dimension)
+          that follows the previously pushed data.
+
+        Returns
+        -------
+        mask : |np.ndarray|
+          Logical array with spikes labeled as 'True', for the points
+          whose window is complete (which may be none of them).
+        """
+
+        if not isinstance(u, np.ndarray):
+            u = u.values
+        if self._buf is None:
+            self._buf = np.empty(u.shape[:-1] + (0, ), dtype=u.dtype)
+        buf = np.concatenate([self._buf, u], axis=-1)
+        self._n_in += u.shape[-1]
+        npt, step = self.npt, self.step
+        off = (npt - step) // 2
+        n_win = (self._n_in - npt) // step + 1 - self._iwin
+        n_win = max(n_win, 0)
+        out = []
+        if n_win > 0:
+            i0 = self._iwin * step - self._b0
+            i1 = i0 + (n_win - 1) * step + npt
+            wins = sliding_window_view(buf[..., i0:i1], npt,
+                                       axis=-1)[..., ::step, :]
+            wins = np.moveaxis(wins, -2, 0)
+            n_blk = max(_block_size // wins[0].size, 1)
+            for iw in range(0, n_win, n_blk):
+                blk = wins[iw:iw + n_blk]
+                mask = _phaseSpaceThresh(
+                    blk.reshape(-1, npt).T).T.reshape(blk.shape)
+                if self._iwin + iw == 0:
+                    # The points before the center of the first window
+                    out.append(mask[0, ..., :off])
+                # The central points of each window, in order
+                mask = np.moveaxis(mask[..., off:off + step], 0, -2)
+                out.append(mask.reshape(mask.shape[:-2] + (-1, )))
+            self._iwin += n_win
+            self._n_out = (self._iwin - 1) * step + off + step
+        # Keep the data of the next window, and the last `npt` points
+        b0 = max(min(self._iwin * step, self._n_in - npt), self._b0)
+        self._buf = buf[..., b0 - self._b0:].copy()
+        self._b0 = b0
+        if not out:
+            return np.zeros(buf.shape[:-1] + (0, ), dtype='bool')
+        return np.concatenate(out, axis=-1)
+
+    def flush(self):
+        """Output the mask of the remaining data, which is despiked with
+        the window of the last `npt` points, and reset the despiker.
+
+        Returns
+        -------
+        mask : |np.ndarray|
+          Logical array with spikes labeled as 'True', for the points
+          that were not output by `push`.
+        """
+
+        if self._buf is None:
+            return np.zeros(0, dtype='bool')
+        buf = self._buf
+        n_rest = self._n_in - self._n_out
+        if n_rest == 0:
+            out = np.zeros(buf.shape[:-1] + (0, ), dtype='bool')
+        else:
+            # The last `npt` points (or all of them)
+            tail = buf[..., -self.npt:]
+            mask = _phaseSpaceThresh(tail.reshape(-1, tail.shape[-1]).T).T
+            out = mask.reshape(tail.shape)[..., tail.shape[-1] - n_rest:]
+        self.reset()
+        return out
@@ -2,10 +2,10 @@ import numpy as np
 import xarray as xr
 import warnings
 import scipy.signal as ss
-from scipy.integrate import cumtrapz
 
 from ..rotate import vector as rot
 from ..rotate.api import _make_model, rotate2
+from ..rotate.base import _orient_stacks
 
 
 def _get_body2imu(make_model):
@@ -16,6 +16,70 @@ def _get_body2imu(make_model):
         raise Exception("The imu->body vector is unknown for this instrument.")
 
 
+def _check_filtfreqs(ds, accel_filtfreq, vel_filtfreq, default):
+    """Returns the (accel_filtfreq, vel_filtfreq) to use for `ds`."""
+    datval = ds.attrs.get('motion accel_filtfreq Hz', None)
+    if datval is None:
+        if accel_filtfreq is None:
+            accel_filtfreq = default
+            # else use the accel_filtfreq value
+    else:
+        if accel_filtfreq is None:
+            accel_filtfreq = datval
+        else:
+            if datval != accel_filtfreq:
+                warnings.warn(
+                    f"The default accel_filtfreq is {datval} Hz. "
+                    "Overriding this with the user-specified "
+                    "value: {accel_filtfreq} Hz.")
+    if vel_filtfreq is None:
+        vel_filtfreq = ds.attrs.get('motion vel_filtfreq Hz', None)
+    if vel_filtfreq is None:
+        vel_filtfreq = accel_filtfreq / 3.0
+    return accel_filtfreq, vel_filtfreq
+
+
+def _check_duty_cycle(ds):
+    """Returns the number of points in each burst of duty-cycled data
+    (None if it isn't duty cycled), after checking that the duty cycle
+    is followed consistently in the datafile.
+    """
+    n_burst = ds.attrs.get('duty_cycle_n_burst')
+    if not n_burst:
+        return
+
+    # duty cycle interval in seconds
+    interval = ds.attrs.get('duty_cycle_interval')
+    actual_interval = (
+        ds.time[n_burst:].values - ds.time[:-n_burst].values)/1e9
+    if not actual_interval.size:
+        # A single burst
+        return n_burst
+
+    rng = actual_interval.max() - actual_interval.min()
+    mean = actual_interval.mean()
+    # Range will vary depending on how datetime64 rounds the timestamp
+    # But isn't an issue if it does
+    if rng > 2 or (mean > interval+1 and mean < interval-1):
+        raise Exception("Bad duty cycle detected")
+
+    # If this passes, it means we're safe to blindly skip n_burst for every integral
+    return n_burst
+
+
+def _filter_overlap(fs, accel_filtfreq, vel_filtfreq, tol=1e-9):
+    """The number of points over which the edge effects of the
+    acceleration and velocity filters of :class:`CalcMotion` decay
+    below `tol` (relative to the signal)."""
+    n = 0
+    for order, freq in [(1, accel_filtfreq), (2, vel_filtfreq)]:
+        sos = ss.butter(order, freq / (fs / 2), output='sos')
+        # The slowest decaying pole
+        r = np.abs(ss.sos2zpk(sos)[1]).max()
+        n += int(np.ceil(np.log(tol) / np.log(r)))
+    return n
+
+
 class CalcMotion():
     """A 'calculator' for computing the velocity of points that are
     rigidly connected to an ADV-body with an IMU.
@@ -49,32 +113,15 @@ class CalcMotion():
         self.angrt = ds['angrt'].values  # No copy because not modified.
 
     def _check_filtfreqs(self, accel_filtfreq, vel_filtfreq):
-        datval = self.ds.attrs.get('motion accel_filtfreq Hz', None)
-        if datval is None:
-            if accel_filtfreq is None:
-                accel_filtfreq = self._default_accel_filtfreq
-                # else use the accel_filtfreq value
-        else:
-            if accel_filtfreq is None:
-                accel_filtfreq = datval
-            else:
-                if datval != accel_filtfreq:
-                    warnings.warn(
-                        f"The default accel_filtfreq is {datval} Hz. "
-                        "Overriding this with the user-specified "
-                        "value: {accel_filtfreq} Hz.")
-        if vel_filtfreq is None:
-            vel_filtfreq = self.ds.attrs.get('motion vel_filtfreq Hz', None)
-        if vel_filtfreq is None:
-            vel_filtfreq = accel_filtfreq / 3.0
-        self.accel_filtfreq = accel_filtfreq
-        self.accelvel_filtfreq = vel_filtfreq
+        self.accel_filtfreq, self.accelvel_filtfreq = _check_filtfreqs(
+            self.ds, accel_filtfreq, vel_filtfreq,
+            self._default_accel_filtfreq)
 
     def _set_accel(self, ):
         ds = self.ds
         if ds.coord_sys == 'inst':
-            self.accel = np.einsum('ij...,i...->j...',
-                                   ds['orientmat'].values,
+            self.accel = np.einsum('ij...,j...->i...',
+                                   _orient_stacks(ds['orientmat'])[0],
                                    ds['accel'].values)
         elif self.ds.coord_sys == 'earth':
             self.accel = ds['accel'].values.copy()
@@ -88,25 +135,7 @@ class CalcMotion():
         """Function to check if duty cycle exists and if it is followed
         consistently in the datafile
         """
-
-        n_burst = self.ds.attrs.get('duty_cycle_n_burst')
-        if not n_burst:
-            return
-
-        # duty cycle interval in seconds
-        interval = self.ds.attrs.get('duty_cycle_interval')
-        actual_interval = (
-            self.ds.time[n_burst:].values - self.ds.time[:-n_burst].values)/1e9
-
-        rng = actual_interval.max() - actual_interval.min()
-        mean = actual_interval.mean()
-        # Range will vary depending on how datetime64 rounds the timestamp
-        # But isn't an issue if it does
-        if rng > 2 or (mean > interval+1 and mean < interval-1):
-            raise Exception("Bad duty cycle detected")
-
-        # If this passes, it means we're safe to blindly skip n_burst for every integral
-        return n_burst
+        return _check_duty_cycle(self.ds)
 
     def reshape(self, dat, n_bin):
         # Assumes shape is (3, time)
@@ -123,20 +152,23 @@ class CalcMotion():
                           "at the beginning and end of each duty cycle.")
             self.accel = self.reshape(self.accel, n_bin=n)
 
-        self.acclow = acc = self.accel.copy()
         if self.accel_filtfreq == 0:
+            acc = self.accel.copy()
             acc[:] = acc.mean(-1)[..., None]
         else:
-            flt = ss.butter(1, self.accel_filtfreq / (self.ds.fs / 2))
-            for idx in range(3):
-                acc[idx] = ss.filtfilt(flt[0], flt[1], acc[idx], axis=-1)
+            # All components (and bursts) at once
+            sos = ss.butter(1, self.accel_filtfreq / (self.ds.fs / 2),
+                            output='sos')
+            acc = ss.sosfiltfilt(sos, self.accel, axis=-1).astype(
+                self.accel.dtype, copy=False)
 
             # Fill nan with zeros - happens for some filter frequencies
             if np.isnan(acc).any():
                 warnings.warn(
                     "Error filtering acceleration data. "
                     "Please decrease `accel_filtfreq`.")
-                acc = np.nan_to_num(acc)
+                np.nan_to_num(acc, copy=False)
+        self.acclow = acc
 
     def calc_velacc(self, ):
         """Calculates the translational velocity from the high-pass
@@ -157,40 +189,34 @@ class CalcMotion():
         # Get high-pass accelerations
         hp = self.accel - self.acclow
 
-        # Integrate in time to get velocities
-        dat = np.concatenate((np.zeros(list(hp.shape[:-1]) + [1]),
-                              cumtrapz(hp, dx=1 / samp_freq, axis=-1)), axis=-1)
+        # Integrate in time to get velocities (i.e. cumtrapz, in place)
+        hp[..., 1:] += hp[..., :-1]
+        hp[..., 1:] *= 1 / samp_freq
+        hp[..., 1:] /= 2.0
+        np.cumsum(hp[..., 1:], axis=-1, out=hp[..., 1:])
+        hp[..., 0] = 0
+        dat = hp.astype(np.float64, copy=False)
 
         if self.accelvel_filtfreq > 0:
             filt_freq = self.accelvel_filtfreq
             # 2nd order Butterworth filter
             # Applied twice by 'filtfilt' = 4th order butterworth
-            filt = ss.butter(2, float(filt_freq) / (samp_freq / 2))
-            for idx in range(hp.shape[0]):
-                dat[idx] = dat[idx] - \
-                    ss.filtfilt(filt[0], filt[1], dat[idx], axis=-1)
+            sos = ss.butter(2, float(filt_freq) / (samp_freq / 2),
+                            output='sos')
+            dat -= ss.sosfiltfilt(sos, dat, axis=-1)
 
             # Fill nan with zeros - happens for some filter frequencies
             if np.isnan(dat).any():
                 warnings.warn("Error filtering acceleration data. "
                               "Please decrease `vel_filtfreq`. "
                               "(default is 1/3 `accel_filtfreq`)")
-                dat = np.nan_to_num(dat)
+                np.nan_to_num(dat, copy=False)
 
         if n:
             # remove reshape
-            velacc_shaped = np.empty(self.angrt.shape)
-            acclow_shaped = np.empty(self.angrt.shape)
-            accel_shaped = np.empty(self.angrt.shape)
-            for idx in range(hp.shape[0]):
-                velacc_shaped[idx] = np.ravel(dat[idx], 'C')
-                acclow_shaped[idx] = np.ravel(self.acclow[idx], 'C')
-                accel_shaped[idx] = np.ravel(self.accel[idx], 'C')
-
-            # return acclow and velacc
-            self.acclow = acclow_shaped
-            self.accel = accel_shaped
-            return velacc_shaped
+            self.acclow = self.acclow.reshape(self.angrt.shape)
+            self.accel = self.accel.reshape(self.angrt.shape)
+            return dat.reshape(self.angrt.shape)
 
         else:
             return dat
@@ -241,8 +267,9 @@ class CalcMotion():
                            ])
 
         if to_earth:
-            velrot = np.einsum('ji...,j...->i...',
-                               self.ds['orientmat'].values, velrot)
+            velrot = np.einsum('ij...,j...->i...',
+                               _orient_stacks(self.ds['orientmat'])[0],
+                               velrot)
 
         if dimflag:
             return velrot[:, 0, :]
@@ -299,7 +326,9 @@ def correct_motion(ds,
                    accel_filtfreq=None,
                    vel_filtfreq=None,
                    to_earth=True,
-                   separate_probes=False):
+                   separate_probes=False,
+                   chunk_size=None,
+                   diagnostics=True):
     """This function performs motion correction on an IMU-ADV data
     object. The IMU and ADV data should be tightly synchronized and
     contained in a single data object.
@@ -329,12 +358,26 @@ def correct_motion(ds,
       lower than the noise levels of the ADV, so the default is to not
       use it (False).
 
+    chunk_size : int (optional, default: None)
+      The number of points in each block of time that the data is
+      motion corrected in. By default the whole record is processed at
+      once. Each block is padded with the data on either side of it,
+      over the length of the filters' edge effects, so that the result
+      matches the default to within the rounding error of integrating
+      the (float32) accelerations, ~1e-6 m/s. The blocks of duty-cycled data are whole bursts.
+
+    diagnostics : bool (optional, default: True)
+      Whether to store ``vel_raw``, ``velrot``, ``velacc`` and
+      ``acclow`` in the output. Setting this to False (and
+      `chunk_size`) reduces the memory used for long records.
+
     Returns
     -------
     This function returns None, it operates on the input data object,
-    ``ds``. The following attributes are added to `ds`:
+    ``ds``. The following attributes are added to `ds` (if
+    `diagnostics` is True):
 
-      ``velraw`` is the uncorrected velocity
+      ``vel_raw`` is the uncorrected velocity
 
       ``velrot`` is the rotational component of the head motion (from
                  angrt)
@@ -347,7 +390,7 @@ def correct_motion(ds,
     The primary velocity vector attribute, ``vel``, is motion corrected
     such that:
 
-          vel = velraw + velrot + velacc
+          vel = vel_raw + velrot + velacc
 
     The sigs are correct in this equation. The measured velocity
     induced by head-motion is *in the opposite direction* of the head
@@ -389,8 +432,12 @@ def correct_motion(ds,
     remove that sigal from the ADV sigal in post-processing.
     """
 
-    # Ensure acting on new dataset
-    ds = ds.copy(deep=True)
+    if chunk_size is None:
+        # Ensure acting on new dataset
+        ds = ds.copy(deep=True)
+    else:
+        # The outputs are written to new arrays
+        ds = ds.copy(deep=False)
 
     # Check that no nan's exist
     if ds['accel'].isnull().sum():
@@ -412,6 +459,23 @@ def correct_motion(ds,
     # Bad configs raises errors (this is to check for those)
     rot._check_inst2head_rotmat(ds)
 
+    if chunk_size is not None:
+        return _correct_motion_chunked(ds, chunk_size, accel_filtfreq,
+                                       vel_filtfreq, to_earth,
+                                       separate_probes, diagnostics)
+
+    ds = _correct_motion(ds, accel_filtfreq, vel_filtfreq, to_earth,
+                         separate_probes)
+    if not diagnostics:
+        ds = _drop_diagnostics(ds)
+    return ds
+
+
+def _correct_motion(ds, accel_filtfreq, vel_filtfreq, to_earth,
+                    separate_probes):
+    """Motion correct `ds` (in place), which has been checked and is in
+    the 'inst' frame."""
+
     # Create the motion 'calculator':
     calcobj = CalcMotion(ds,
                          accel_filtfreq=accel_filtfreq,
@@ -509,3 +573,64 @@ def correct_motion(ds,
     ds.attrs['motion accel_filtfreq Hz'] = calcobj.accel_filtfreq
 
     return ds
+
+
+# The variables added by `correct_motion` for diagnostics
+_diagnostic_vars = ['vel_raw', 'velrot', 'velacc', 'acclow']
+
+
+def _drop_diagnostics(ds):
+    ds = ds.drop_vars(_diagnostic_vars)
+    ds.attrs['rotate_vars'] = [nm for nm in ds.attrs['rotate_vars']
+                               if nm not in _diagnostic_vars]
+    return ds
+
+
+def _correct_motion_chunked(ds, chunk_size, accel_filtfreq, vel_filtfreq,
+                            to_earth, separate_probes, diagnostics):
+    """Motion correct `ds` in blocks of `chunk_size` points, writing the
+    outputs into new (float32) arrays."""
+    accel_filtfreq, vel_filtfreq = _check_filtfreqs(
+        ds, accel_filtfreq, vel_filtfreq, CalcMotion._default_accel_filtfreq)
+    n_burst = _check_duty_cycle(ds)
+    if n_burst:
+        # Bursts are corrected independently
+        chunk_size = max(chunk_size // n_burst, 1) * n_burst
+        pad = 0
+    elif accel_filtfreq > 0 and vel_filtfreq > 0:
+        pad = _filter_overlap(ds.fs, accel_filtfreq, vel_filtfreq)
+    else:
+        raise ValueError("Motion correction in chunks requires "
+                         "`accel_filtfreq` and `vel_filtfreq` greater "
+                         "than zero (unless the data is duty cycled).")
+
+    n_time = ds.time.size
+    out = {}
+    for i0 in range(0, n_time, chunk_size):
+        i1 = min(i0 + chunk_size, n_time)
+        j0, j1 = max(i0 - pad, 0), min(i1 + pad, n_time)
+        dat = ds.isel(time=slice(j0, j1)).copy(deep=True)
+        dat = _correct_motion(dat, accel_filtfreq, vel_filtfreq, to_earth,
+                              separate_probes)
+        if not diagnostics:
+            dat = _drop_diagnostics(dat)
+        if i0 == 0:
+            # The variables that are changed, or added
+            template = dat
+            for nm in dat.attrs['rotate_vars']:
+                if nm in dat and 'time' in dat[nm].dims:
+                    shape = list(dat[nm].shape)
+                    shape[dat[nm].get_axis_num('time')] = n_time
+                    out[nm] = np.empty(shape, dtype=dat[nm].dtype)
+        for nm, arr in out.items():
+            ax = dat[nm].get_axis_num('time')
+            inds = [slice(None)] * arr.ndim
+            inds[ax] = slice(i0, i1)
+            arr[tuple(inds)] = dat[nm][{'time': slice(i0 - j0, i1 - j0)}]
+
+    for nm, arr in out.items():
+        ds[nm] = (template[nm].dims, arr, template[nm].attrs)
+    ds = ds.assign_coords({nm: template[nm] for nm in template.coords
+                           if 'time' not in template[nm].dims})
+    ds.attrs = template.attrs
+    return ds
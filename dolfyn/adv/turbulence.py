@@ -1,7 +1,12 @@
+import os
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from ..velocity import VelBinner
+from ..binned import _block_size
+from ..io.cache import _user_cache_dir
 import warnings
-from ..tools.misc import slice1d_along_axis, _nans_like
 from scipy.special import cbrt
 import xarray as xr
 
@@ -25,20 +30,19 @@ class ADVBinner(VelBinner):
       Instrument noise level in same units as velocity. Typically
       found from `adv.turbulence.calc_doppler_noise`. 
       Default: None.
+    dtype : str or numpy.dtype (default: None)
+      The precision of the calculations. 'float32' keeps the data,
+      intermediate arrays and ffts in single precision.
     """
 
-    def __call__(self, ds, freq_units='rad/s', window='hann'):
-        out = type(ds)()
-        out = self.do_avg(ds, out)
-
+    def __call__(self, ds, freq_units='rad/s', window='hann', workers=None):
         noise = ds.get('doppler_noise', [0, 0, 0])
-        out['tke_vec'] = self.calc_tke(ds['vel'], noise=noise)
-        out['stress_vec'] = self.calc_stress(ds['vel'])
+        if workers in [None, 1]:
+            out = self._turbulence(ds, freq_units, window, noise, noise)
+        else:
+            out = self._turbulence_parallel(ds, freq_units, window, noise,
+                                           workers)
 
-        out['psd'] = self.calc_psd(ds['vel'],
-                                   window=window,
-                                   freq_units=freq_units,
-                                   noise=noise)
         for key in list(ds.attrs.keys()):
             if 'config' in key:
                 ds.attrs.pop(key)
@@ -49,6 +53,64 @@ class ADVBinner(VelBinner):
 
         return out
 
+    def _turbulence(self, ds, freq_units, window, noise, psd_noise):
+        out = type(ds)()
+        out = self.do_avg(ds, out)
+
+        out['tke_vec'] = self.calc_tke(ds['vel'], noise=noise)
+        out['stress_vec'] = self.calc_stress(ds['vel'])
+
+        out['psd'] = self.calc_psd(ds['vel'],
+                                   window=window,
+                                   freq_units=freq_units,
+                                   noise=psd_noise)
+        return out
+
+    def _turbulence_parallel(self, ds, freq_units, window, noise, workers):
+        """Calculate `_turbulence` for chunks of bins of `ds` in a pool of
+        `workers` processes, and concatenate the output.
+        """
+        if np.mod(self.n_bin, 1) != 0:
+            raise ValueError("Parallel binning requires an integer `n_bin`.")
+        if workers < 0:
+            workers = max(os.cpu_count() + 1 + workers, 1)
+        n_bin = int(self.n_bin)
+        n_bins = ds['time'].size // n_bin
+        if n_bins == 0:
+            raise Exception('n_bin is larger than length of input array')
+        # A few chunks per worker, to balance the load
+        n_chunk = int(np.ceil(n_bins / (4 * workers)))
+
+        outs = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Limit the number of chunks that are queued at once
+            futures = deque()
+            for b0 in range(0, n_bins, n_chunk):
+                b1 = min(b0 + n_chunk, n_bins)
+                # Each chunk includes the bins before and after it (or the
+                # rest of the data), for the overlap of the spectra
+                i0 = max(b0 - 1, 0) * n_bin
+                i1 = (b1 + 1) * n_bin if b1 < n_bins else ds['time'].size
+                if len(futures) >= 2 * workers:
+                    outs.append(futures.popleft().result())
+                futures.append(pool.submit(
+                    _turbulence_chunk, self, ds.isel(time=slice(i0, i1)),
+                    freq_units, window, noise, int(b0 > 0), b1 - b0))
+            outs += [fut.result() for fut in futures]
+        out = xr.concat(outs, dim='time', data_vars='minimal',
+                        coords='minimal', compat='override',
+                        combine_attrs='override')
+
+        # The noise is subtracted from the spectra of the whole dataset,
+        # as it also sets the minimum value of the spectra.
+        if 'xarray' in type(noise).__module__:
+            noise = noise.values
+        fs = self.fs * 2 * np.pi if 'rad' in freq_units else self.fs
+        psd = out['psd'].values
+        for idx in range(3):
+            psd[idx] = self._subtract_noise(psd[idx], noise[idx], fs)
+        return out
+
     def calc_stress(self, veldat, detrend=True):
         """
         Calculate the stresses (covariances of u,v,w in m^2/s^2)
@@ -70,7 +132,7 @@ class ADVBinner(VelBinner):
         """
 
         time = self.mean(veldat.time.values)
-        vel = veldat.values
+        vel = self._astype(veldat.values)
 
         out = np.empty(self._outshape(vel.shape)[:-1],
                        dtype=np.float32)
@@ -82,7 +144,7 @@ class ADVBinner(VelBinner):
 
         for idx, p in enumerate(self._cross_pairs):
             out[idx] = np.nanmean(vel[p[0]] * vel[p[1]],
-                                  -1, dtype=np.float64
+                                  -1, dtype=self.dtype or np.float64
                                   ).astype(np.float32)
 
         da = xr.DataArray(out.astype('float32'), 
@@ -135,7 +197,7 @@ class ADVBinner(VelBinner):
                             "the 3D velocity vector from an ADV.")
 
         out = np.empty(self._outshape_fft(veldat[:3].shape, n_fft=n_fft, n_bin=n_bin),
-                       dtype='complex')
+                       dtype=self._cdtype)
 
         # Create frequency vector, also checks whether using f or omega
         if 'rad' in freq_units:
@@ -357,24 +419,34 @@ class ADVBinner(VelBinner):
         else:
             noise = np.array([0, 0, 0])[:, None, None]
 
-        # Noise subtraction from binner.TimeBinner.calc_psd_base
-        psd = psd.copy()
-        if noise is not None:
-            psd -= (noise**2 / (self.fs / 2))
-            psd = psd.where(psd > 0, np.min(np.abs(psd)) / 100)
-
-        freq = psd.freq
-        idx = np.where((freq_range[0] < freq) & (freq < freq_range[1]))
-        idx = idx[0]
+        freq = psd['freq'].values
+        inds = (freq_range[0] < freq) & (freq < freq_range[1])
 
-        if freq.units == 'Hz':
+        # Noise subtraction from binner.TimeBinner.calc_psd_base
+        if 'xarray' in type(noise).__module__:
+            # Line the noise's dimensions up with the psd's
+            noise = noise.transpose(*[d for d in psd.dims if d in noise.dims])
+            noise = noise.values.reshape([psd.sizes[d] if d in noise.dims
+                                          else 1 for d in psd.dims])
+        spec = psd.values
+        if np.any(noise):
+            spec = (spec - np.asarray(noise)**2 / (self.fs / 2)).astype(
+                psd.dtype, copy=False)
+        dat = spec[..., inds]
+        bad = ~(dat > 0)
+        if bad.any():
+            dat[bad] = np.nanmin(np.abs(spec)) / 100
+
+        if psd['freq'].units == 'Hz':
             U = U_mag/(2*np.pi)
         else:
             U = U_mag
 
         a = 0.5
-        out = (psd.isel(freq=idx) *
-               freq.isel(freq=idx)**(5/3) / a).mean(axis=-1)**(3/2) / U
+        out = np.nanmean(dat * freq[inds]**(5/3) / a, axis=-1)
+        out = xr.DataArray(out, dims=psd.dims[:-1],
+                           coords={ky: val for ky, val in psd.coords.items()
+                                   if 'freq' not in val.dims})**(3/2) / U
 
         return xr.DataArray(
             out.astype('float32'),
@@ -417,16 +489,21 @@ class ADVBinner(VelBinner):
             warnings.warn('Max freq_range cannot be greater than fs')
 
         dt = self.reshape(veldat)
-        out = np.empty(dt.shape[:-1], dtype=dt.dtype)
-        for slc in slice1d_along_axis(dt.shape, -1):
-            up = dt[slc]
-            lag = U_mag.values[slc[:-1]] / fs * np.arange(up.shape[0])
-            DAA = _nans_like(lag)
-            for L in range(int(fs / freq_range[1]), int(fs / freq_range[0])):
-                DAA[L] = np.nanmean((up[L:] - up[:-L]) ** 2, dtype=np.float64)
-            cv2 = DAA / (lag ** (2 / 3))
-            cv2m = np.median(cv2[np.logical_not(np.isnan(cv2))])
-            out[slc[:-1]] = (cv2m / 2.1) ** (3 / 2)
+        lags = np.arange(int(fs / freq_range[1]), int(fs / freq_range[0]))
+
+        def struct_func(up):
+            # The second-order structure function of each bin, at each lag
+            DAA = np.empty(up.shape[:-1] + lags.shape)
+            for i, L in enumerate(lags):
+                DAA[..., i] = np.nanmean((up[..., L:] - up[..., :-L]) ** 2,
+                                         axis=-1, dtype=np.float64)
+            return DAA
+
+        DAA = self._blockwise(struct_func,
+                              np.empty(dt.shape[:-1] + lags.shape), dt)
+        lag = U_mag.values.astype(np.float64)[..., None] / fs * lags
+        cv2m = np.nanmedian(DAA / (lag ** (2 / 3)), axis=-1)
+        out = ((cv2m / 2.1) ** (3 / 2)).astype(dt.dtype)
 
         return xr.DataArray(
             out.astype('float32'),
@@ -460,7 +537,8 @@ class ADVBinner(VelBinner):
         return np.angle(np.mean(dt, -1, dtype=np.complex128))
 
     def _calc_epsTE01_int(self, I_tke, theta):
-        """The integral, equation A13, in [TE01].
+        """The integral, equation A13, in [TE01] (interpolated from a
+        table of its values).
 
         Parameters
         ----------
@@ -472,15 +550,7 @@ class ADVBinner(VelBinner):
           velocity fluctuations
         """
 
-        x = np.arange(-20, 20, 1e-2)  # I think this is a long enough range.
-        out = np.empty_like(I_tke.flatten())
-        for i, (b, t) in enumerate(zip(I_tke.flatten(), theta.flatten())):
-            out[i] = np.trapz(
-                cbrt(x**2 - 2/b*np.cos(t)*x + b**(-2)) *
-                np.exp(-0.5 * x ** 2), x)
-
-        return out.reshape(I_tke.shape) * \
-            (2 * np.pi) ** (-0.5) * I_tke ** (2 / 3)
+        return _te01_int(I_tke, theta)
 
     def calc_epsilon_TE01(self, dat_raw, dat_avg, freq_range=[6.28, 12.57]):
         """Calculate the dissipation rate according to TE01.
@@ -499,6 +569,10 @@ class ADVBinner(VelBinner):
 
         Notes
         -----
+        The integral, equation A13, is interpolated from a table of its
+        values (to within a relative error of 1e-4), which is calculated
+        at first use and saved in DOLfYN's user cache directory.
+
         TE01 : Trowbridge, J and Elgar, S, "Turbulence measurements in
         the Surf Zone". JPO, 2001, vol31, pp2403-2417.
         """
@@ -581,7 +655,152 @@ class ADVBinner(VelBinner):
                    'standard_name': 'turbulent_mixing_length_of_sea_water'})
 
 
-def calc_turbulence(ds_raw, n_bin, fs, n_fft=None, freq_units='rad/s', window='hann'):
+# The grid of the TE01 integral table: I_tke (uniform), and the angle
+# theta in [0, pi/2] (uniform in sqrt(theta), because the integral
+# varies as theta**(5/3) near 0)
+_te01_I_tke = np.linspace(0, 4, 201)
+_te01_theta = np.pi / 2 * np.linspace(0, 1, 101) ** 2
+# The maximum relative error of interpolating the table
+_te01_rtol = 1e-4
+_te01 = {}
+
+
+def _te01_int_direct(I_tke, theta):
+    """The integral, equation A13, in [TE01] (times
+    ``(2 * pi) ** -0.5 * I_tke ** (2 / 3)``), calculated numerically for
+    all values of `I_tke` and `theta` at once.
+    """
+    # Written as the mean (over x ~ N(0, 1)) of
+    # ((I_tke*x - cos(theta))**2 + sin(theta)**2)**(1/3)
+    # The integrand is negligible beyond |x| = 10
+    x = np.arange(-1000, 1001) * 1e-2
+    wt = np.exp(-0.5 * x ** 2) * (2 * np.pi) ** (-0.5) * 1e-2
+    wt[[0, -1]] /= 2  # trapezoidal rule
+
+    b, t = np.broadcast_arrays(np.asarray(I_tke, dtype=np.float64),
+                               np.asarray(theta, dtype=np.float64))
+    shape = b.shape
+    b, t = b.ravel(), t.ravel()
+    cos, sin2 = np.cos(t), np.sin(t) ** 2
+    out = np.empty(b.shape)
+    n_blk = max(_block_size // x.size, 1)
+    for i0 in range(0, b.size, n_blk):
+        i1 = i0 + n_blk
+        out[i0:i1] = cbrt((b[i0:i1, None] * x - cos[i0:i1, None]) ** 2 +
+                          sin2[i0:i1, None]) @ wt
+    return out.reshape(shape)
+
+
+def _te01_table(cache_dir=None):
+    """The table of `_te01_int_direct` over the `_te01_I_tke` and
+    `_te01_theta` grid.
+
+    It is calculated at first use, along with the maximum relative error
+    of interpolating it (at the center of each cell), and saved in
+    `cache_dir` (default: the 'tables' directory in DOLfYN's user cache
+    directory) for later sessions.
+    """
+    if 'table' in _te01 and cache_dir is None:
+        return _te01['table']
+    if cache_dir is None:
+        cache_dir = _user_cache_dir('tables')
+    hsh = hashlib.sha1(_te01_I_tke.tobytes() + _te01_theta.tobytes())
+    fname = os.path.join(cache_dir,
+                         'te01_int-{}.npz'.format(hsh.hexdigest()[:16]))
+
+    # Check a few nodes of a saved table against the direct integral
+    inds = np.ix_([0, _te01_I_tke.size // 2, -1],
+                  [0, _te01_theta.size // 2, -1])
+    try:
+        with np.load(fname) as fl:
+            table, error = fl['table'], float(fl['error'])
+        if not np.allclose(table[inds],
+                           _te01_int_direct(_te01_I_tke[inds[0]],
+                                            _te01_theta[inds[1]]),
+                           rtol=1e-12, atol=0):
+            raise ValueError("Invalid TE01 integral table.")
+    except Exception:
+        table = _te01_int_direct(_te01_I_tke[:, None], _te01_theta[None, :])
+        # Bilinear interpolation at the center of each cell is the mean
+        # of its corners
+        center = _te01_int_direct(
+            (_te01_I_tke[1:, None] + _te01_I_tke[:-1, None]) / 2,
+            np.pi / 2 * ((np.sqrt(_te01_theta[1:]) +
+                          np.sqrt(_te01_theta[:-1])) / 2 /
+                         np.sqrt(np.pi / 2)) ** 2)
+        error = np.abs((table[1:, 1:] + table[1:, :-1] + table[:-1, 1:] +
+                        table[:-1, :-1]) / 4 / center - 1).max()
+        if error > _te01_rtol:
+            warnings.warn("The interpolation error of the TE01 integral "
+                          "table is {:.1e}.".format(error))
+
+        tmp_file = '{}-{}.tmp'.format(fname, os.getpid())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_file, 'wb') as fl:
+                np.savez(fl, table=table, error=error)
+            os.replace(tmp_file, fname)
+        except Exception as err:
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+            warnings.warn("Could not write the TE01 integral table to the "
+                          "cache directory {}: {}".format(cache_dir, err))
+
+    _te01.clear()
+    _te01['table'], _te01['error'] = table, error
+    return table
+
+
+def _te01_cells():
+    """The coefficients of the bilinear interpolation in each cell of
+    `_te01_table`, in the rows of a (n_cells, 4) array so that they are
+    looked up together."""
+    if 'cells' not in _te01:
+        table = _te01_table()
+        c00, c01 = table[:-1, :-1], table[:-1, 1:]
+        c10, c11 = table[1:, :-1], table[1:, 1:]
+        _te01['cells'] = np.stack([c00, c01 - c00, c10 - c00,
+                                   c11 - c10 - c01 + c00],
+                                  axis=-1).reshape(-1, 4)
+    return _te01['cells']
+
+
+def _te01_int(I_tke, theta):
+    """The integral, equation A13, in [TE01] (times
+    ``(2 * pi) ** -0.5 * I_tke ** (2 / 3)``), interpolated (bilinearly)
+    from `_te01_table`, or calculated directly for `I_tke` outside of
+    it.
+    """
+    b = np.asarray(I_tke, dtype=np.float64)
+    # The integral depends on theta through |cos(theta)|
+    t = np.arccos(np.abs(np.cos(theta))) + np.zeros_like(b)
+    out = np.empty(b.shape)
+
+    # NaNs (in either) are passed to the direct integral, which is NaN
+    inside = (b >= 0) & (b <= _te01_I_tke[-1]) & np.isfinite(t)
+    bi = b[inside] / (_te01_I_tke[1] - _te01_I_tke[0])
+    ti = np.sqrt(t[inside] / (np.pi / 2)) * (_te01_theta.size - 1)
+    i = np.minimum(bi.astype(int), _te01_I_tke.size - 2)
+    j = np.minimum(ti.astype(int), _te01_theta.size - 2)
+    fi, fj = bi - i, ti - j
+    coef = _te01_cells().take(i * (_te01_theta.size - 1) + j, axis=0)
+    out[inside] = (coef[:, 0] + fj * coef[:, 1] +
+                   fi * (coef[:, 2] + fj * coef[:, 3]))
+    out[~inside] = _te01_int_direct(b[~inside], t[~inside])
+    return out
+
+
+def _turbulence_chunk(binner, ds, freq_units, window, noise, i0, n):
+    """Calculate the turbulence statistics of a chunk of data, and return
+    `n` bins of them starting at bin `i0`. Called by the processes of
+    `ADVBinner._turbulence_parallel`.
+    """
+    out = binner._turbulence(ds, freq_units, window, noise, None)
+    return out.isel(time=slice(i0, i0 + n))
+
+
+def calc_turbulence(ds_raw, n_bin, fs, n_fft=None, freq_units='rad/s', window='hann',
+                    dtype=None, workers=None):
     """Functional version of `ADVBinner` that computes a suite of turbulence 
     statistics for the input dataset, and returns a `binned` data object.
     
@@ -595,6 +814,18 @@ def calc_turbulence(ds_raw, n_bin, fs, n_fft=None, freq_units='rad/s', window='h
       (`f` or :math:`\\omega`)
     window : 1, None, 'hann', 'hamm'
       The window to use for calculating power spectral densities
+    dtype : str or numpy.dtype (default: None)
+      The precision of the calculations, e.g. 'float32' for single
+      precision (see :class:`ADVBinner`).
+    workers : int (default: None)
+      The number of processes to calculate the statistics with. The data
+      is split into chunks of whole bins (that include the overlap of the
+      spectra with the neighbouring bins), which are processed in
+      parallel. Negative values count back from the number of CPUs, so
+      ``workers=-1`` uses all of them. Requires an integer `n_bin`. The
+      noise is then subtracted from the (float32) spectra of all bins,
+      which may differ from those calculated in one process by float32
+      rounding.
     
     Returns
     -------
@@ -625,7 +856,8 @@ def calc_turbulence(ds_raw, n_bin, fs, n_fft=None, freq_units='rad/s', window='h
         - omega : the radial frequncy (rad/s)
     """
     
-    calculator = ADVBinner(n_bin, fs, n_fft=n_fft)
+    calculator = ADVBinner(n_bin, fs, n_fft=n_fft, dtype=dtype)
 
-    return calculator(ds_raw, freq_units=freq_units, window=window)
+    return calculator(ds_raw, freq_units=freq_units, window=window,
+                      workers=workers)
     
\ No newline at end of file
@@ -1,14 +1,56 @@
 import numpy as np
 import warnings
-from .tools.psd import psd_freq, psd, cpsd_quasisync, cpsd
-from .tools.misc import slice1d_along_axis, detrend
+from numpy.lib.stride_tricks import sliding_window_view
+from .tools.psd import psd_freq, psd, cpsd_quasisync, cpsd, _getwindow
+from .tools.misc import detrend
 from .time import epoch2dt64, dt642epoch
 warnings.simplefilter('ignore', RuntimeWarning)
 
+# Approximate number of data points that are processed at once by the
+# vectorized spectra calculations.
+_block_size = 2 ** 22
+
+
+# The statistics that can be calculated by `TimeBinner._calc_stats`
+_stats = ['mean', 'var', 'std', 'min', 'max', 'count']
+
+
+def _bin_stats(arr, stats):
+    """Calculate the `stats` of each row of the 2D array `arr`, ignoring
+    NaNs, with float64 accumulators.
+
+    Returns an array of shape (arr.shape[0], len(stats)).
+    """
+    arr = arr.astype(np.float64)
+    nans = np.isnan(arr)
+    out = {}
+    out['count'] = arr.shape[-1] - nans.sum(-1)
+    if 'min' in stats:
+        # fmin/fmax ignore NaNs (unless all of the values are NaN)
+        out['min'] = np.fmin.reduce(arr, axis=-1)
+    if 'max' in stats:
+        out['max'] = np.fmax.reduce(arr, axis=-1)
+    arr[nans] = 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['mean'] = arr.sum(-1) / out['count']
+        if 'var' in stats or 'std' in stats:
+            # Sum of squared deviations from the mean of each row
+            arr -= out['mean'][:, None]
+            arr[nans] = 0
+            out['var'] = np.einsum('ij,ij->i', arr, arr) / out['count']
+            out['std'] = np.sqrt(out['var'])
+    return np.stack([out[nm] for nm in stats], axis=-1)
+
+
+def _is_dask(arr):
+    """Returns True if `arr` is a dask array (e.g. the data of a dataset
+    opened with ``chunks=...``)."""
+    return type(arr).__module__.split('.')[0] == 'dask'
+
 
 class TimeBinner:
     def __init__(self, n_bin, fs, n_fft=None, n_fft_coh=None,
-                 noise=[0, 0, 0]):
+                 noise=[0, 0, 0], dtype=None):
         """Initialize an averaging object
 
         Parameters
@@ -26,10 +68,17 @@ class TimeBinner:
           Default: `n_fft_coh`=`n_fft`
         noise : float, list or numpy.ndarray
           Instrument's doppler noise in same units as velocity
+        dtype : str or numpy.dtype (default: None)
+          The precision of the calculations. 'float32' converts the data
+          to float32, and keeps the intermediate arrays and ffts
+          (complex64) of the spectra, covariances and turbulence
+          statistics in single precision, which halves their memory use.
+          None uses double precision for the intermediate calculations.
         """
 
         self.n_bin = n_bin
         self.fs = fs
+        self.dtype = None if dtype is None else np.dtype(dtype)
         self.n_fft = n_fft
         self.n_fft_coh = n_fft_coh
         self.noise = noise
@@ -59,6 +108,27 @@ class TimeBinner:
         n_bin = self._parse_nbin(n_bin)
         return list(inshape[:-1]) + [int(inshape[-1] // n_bin), int(n_fft // 2)]
 
+    def _astype(self, arr):
+        """Returns `arr` in the precision of this binner (`dtype`)."""
+        if self.dtype is None or np.dtype(arr.dtype).kind not in 'biufc':
+            return arr
+        if np.iscomplexobj(arr):
+            return arr.astype(self._cdtype, copy=False)
+        return arr.astype(self.dtype, copy=False)
+
+    def _window(self, window, n_fft):
+        """Returns the fft `window` in the precision of this binner."""
+        if self.dtype is None:
+            return window
+        return _getwindow(window, int(n_fft)).astype(self.dtype)
+
+    @property
+    def _cdtype(self):
+        """The dtype of the cross-spectra."""
+        if self.dtype is None:
+            return np.dtype(complex)
+        return np.result_type(self.dtype, np.complex64)
+
     def _parse_fs(self, fs=None):
         if fs is None:
             return self.fs
@@ -160,6 +230,110 @@ class TimeBinner:
 
         return dims_list, coords_dict
 
+    def _blockwise(self, func, out, *dats):
+        """Calculate `out[..., i, :] = func(*[d[..., i, :] for d in dats])`
+        for every bin `i` (of the 'reshape'd `dats`), in blocks of bins
+        that limit the size of the temporary arrays of `func`.
+        """
+
+        n_out = out.shape[-2]
+        dats = [d[..., :n_out, :].reshape(-1, d.shape[-1]) for d in dats]
+        out2d = out.reshape(-1, out.shape[-1])
+        n_blk = max(_block_size // max(d.shape[-1] for d in dats), 1)
+        for i0 in range(0, out2d.shape[0], n_blk):
+            out2d[i0:i0 + n_blk] = func(*[d[i0:i0 + n_blk] for d in dats])
+        return out
+
+    def _padded_bins(self, arr, n_pad, n_bin):
+        """A (read-only) view of `arr` with shape (..., n, n_bin+n_pad),
+        where `arr` already includes the `n_pad` overlap: `n_pad`//2
+        points before the first bin and (`n_pad`+1)//2 points after the
+        last one.
+        """
+        return sliding_window_view(arr, int(n_bin) + int(n_pad),
+                                   axis=-1)[..., ::int(n_bin), :]
+
+    def _map_bins(self, func, arr, n_pad=0, n_bin=None, n_out=None,
+                  dtype=None):
+        """Lazily calculate `func` for each bin of the dask array `arr`.
+
+        `arr` is rechunked along its last (time) axis so that chunk
+        boundaries line up with bins, and each chunk is extended by the
+        `n_pad` overlap from its neighbours (zeros at the ends of the
+        timeseries, as in `reshape`). `func` is called with the
+        'reshape'd chunk, of shape (..., n, n_bin+n_pad), and should
+        reduce its last axis (`n_out` is None), or return an array of
+        shape (..., n, n_out).
+
+        Returns
+        -------
+        out : dask.array.Array
+          The lazy output, of shape (..., n_bins) or (..., n_bins, n_out).
+        """
+
+        import dask.array as da
+
+        n_bin = self._parse_nbin(n_bin)
+        if np.mod(n_bin, 1) != 0:
+            raise ValueError("Chunked (dask) data can only be binned with "
+                             "an integer `n_bin`.")
+        n_bin = int(n_bin)
+        n_pad = int(n_pad)
+        n_bins = arr.shape[-1] // n_bin
+        if n_bins == 0:
+            raise Exception('n_bin is larger than length of input array')
+        ax = arr.ndim - 1
+        # Align the chunk boundaries with the bins
+        arr = arr[..., :n_bins * n_bin]
+        n_chunk = max(int(round(max(arr.chunks[-1]) / n_bin)), 1)
+        arr = arr.rechunk({ax: n_chunk * n_bin})
+        chunks = arr.chunks[:-1] + (tuple(c // n_bin for c in arr.chunks[-1]),)
+        npd0 = int(n_pad // 2)
+        npd1 = int((n_pad + 1) // 2)
+        if n_pad:
+            # Symmetric depth, the extra point is dropped when n_pad is odd
+            arr = da.overlap.overlap(arr, depth={ax: npd1},
+                                     boundary={ax: 0})
+
+        def bin_func(blk):
+            return func(self._padded_bins(blk[..., npd1 - npd0:],
+                                          n_pad, n_bin))
+
+        if n_out is None:
+            return da.map_blocks(bin_func, arr, chunks=chunks,
+                                 dtype=dtype or arr.dtype)
+        return da.map_blocks(bin_func, arr, chunks=chunks + ((n_out, ),),
+                             new_axis=ax + 1, dtype=dtype or arr.dtype)
+
+    def _calc_stats(self, arr, stats, n_bin=None):
+        """Calculate the `stats` (any of `_stats`) of each bin of `arr`
+        in a single pass through the data (of blocks of bins).
+
+        Returns
+        -------
+        out : list of numpy.ndarray
+          The float64 statistics (or dask arrays, for dask input), of
+          shape (..., n) where n is the number of bins.
+        """
+
+        for nm in stats:
+            if nm not in _stats:
+                raise ValueError("Invalid statistic '{}'. Valid statistics "
+                                 "are: {}".format(nm, _stats))
+        if np.dtype(arr.dtype).kind not in 'biuf':
+            raise TypeError("Statistics can only be calculated for real "
+                            "numeric data.")
+        if _is_dask(arr):
+            out = self._map_bins(
+                lambda a: _bin_stats(a.reshape(-1, a.shape[-1]), stats
+                                     ).reshape(a.shape[:-1] + (len(stats), )),
+                arr, n_bin=n_bin, n_out=len(stats), dtype=np.float64)
+        else:
+            dat = self.reshape(arr, n_bin=n_bin)
+            out = np.empty(dat.shape[:-1] + (len(stats), ))
+            self._blockwise(lambda a: _bin_stats(a, stats), out, dat)
+        return [out[..., idx] for idx in range(len(stats))]
+
     def reshape(self, arr, n_pad=0, n_bin=None):
         """Reshape the array `arr` to shape (...,n,n_bin+n_pad).
 
@@ -185,6 +359,10 @@ class TimeBinner:
 
         Notes
         -----
+        `out` is a read-only view, of `arr` when `n_pad` is 0 and `n_bin`
+        is an integer (otherwise of a copy of `arr` with the padding),
+        so it must be copied before it is modified.
+
         `n_bin` can be non-integer, in which case the output array
         size will be `n_pad`+`n_bin`, and the decimal will
         cause skipping of some data points in `arr`.  In particular,
@@ -200,15 +378,11 @@ class TimeBinner:
         npd0 = int(n_pad // 2)
         npd1 = int((n_pad + 1) // 2)
         shp = self._outshape(arr.shape, n_pad=0, n_bin=n_bin)
-        out = np.zeros(
-            self._outshape(arr.shape, n_pad=n_pad, n_bin=n_bin),
-            dtype=arr.dtype)
         if np.mod(n_bin, 1) == 0:
             # n_bin needs to be int
             n_bin = int(n_bin)
-            # If n_bin is an integer, we can do this simply.
-            out[..., npd0: n_bin + npd0] = (
-                arr[..., :(shp[-2] * shp[-1])]).reshape(shp, order='C')
+            # If n_bin is an integer, the bins are contiguous in `arr`
+            arr = arr[..., :(shp[-2] * shp[-1])]
         else:
             inds = (np.arange(np.prod(shp[-2:])) * n_bin // int(n_bin)
                     ).astype(int)
@@ -216,16 +390,16 @@ class TimeBinner:
             if inds[-1] >= arr.shape[-1]:
                 inds = inds[:-int(n_bin)]
                 shp[-2] -= 1
-                out = out[..., 1:, :]
-            n_bin = int(n_bin)
-            out[..., npd0:n_bin + npd0] = (arr[..., inds]
-                                           ).reshape(shp, order='C')
             n_bin = int(n_bin)
-        if n_pad != 0:
-            out[..., 1:, :npd0] = out[..., :-1, n_bin:n_bin + npd0]
-            out[..., :-1, -npd1:] = out[..., 1:, npd0:npd0 + npd1]
-
-        return out
+            arr = arr[..., inds]
+        if npd0 + npd1 == 0:
+            out = arr.reshape(shp, order='C')
+            out.flags.writeable = False
+            return out
+        # Only the zeros at the ends of the timeseries require a copy,
+        # the overlapping bins are views of it.
+        arr = np.pad(arr, [(0, 0)] * (arr.ndim - 1) + [(npd0, npd1)])
+        return self._padded_bins(arr, npd0 + npd1, n_bin)
 
     def detrend(self, arr, axis=-1, n_pad=0, n_bin=None):
         """Reshape the array `arr` to shape (...,n,n_bin+n_pad)
@@ -253,7 +427,14 @@ class TimeBinner:
           Detrended data, where the last axis is of length `int(n_bin)`.
         """
 
-        return detrend(self.reshape(arr, n_pad=n_pad, n_bin=n_bin), axis=axis)
+        arr = self._astype(arr)
+        if _is_dask(arr):
+            n_bin = self._parse_nbin(n_bin)
+            return self._map_bins(
+                lambda a: detrend(a, axis=axis, dtype=self.dtype), arr,
+                n_pad=n_pad, n_bin=n_bin, n_out=int(n_bin) + n_pad)
+        return detrend(self.reshape(arr, n_pad=n_pad, n_bin=n_bin), axis=axis,
+                       dtype=self.dtype)
 
     def demean(self, arr, axis=-1, n_pad=0, n_bin=None):
         """Reshape the array `arr` to shape (...,n,n_bin+n_pad)
@@ -281,6 +462,12 @@ class TimeBinner:
           Demeaned data, where the last axis is of length `int(n_bin)`.
         """
 
+        arr = self._astype(arr)
+        if _is_dask(arr):
+            n_bin = self._parse_nbin(n_bin)
+            return self._map_bins(
+                lambda a: a - np.nanmean(a, axis)[..., None], arr,
+                n_pad=n_pad, n_bin=n_bin, n_out=int(n_bin) + n_pad)
         dt = self.reshape(arr, n_pad=n_pad, n_bin=n_bin)
         return dt - np.nanmean(dt, axis)[..., None]
 
@@ -306,9 +493,15 @@ class TimeBinner:
             return epoch2dt64(self.mean(dt642epoch(arr), axis=axis, n_bin=n_bin))
         if axis != -1:
             arr = np.swapaxes(arr, axis, -1)
-        tmp = self.reshape(arr, n_bin=n_bin)
-
-        return np.nanmean(tmp, -1)
+        if np.iscomplexobj(arr):
+            if _is_dask(arr):
+                return self._map_bins(lambda a: np.nanmean(a, -1), arr,
+                                      n_bin=n_bin)
+            return np.nanmean(self.reshape(arr, n_bin=n_bin), -1)
+        out = self._calc_stats(arr, ['mean'], n_bin=n_bin)[0]
+        if np.dtype(arr.dtype).kind == 'f':
+            out = out.astype(arr.dtype)
+        return out
 
     def var(self, arr, axis=-1, n_bin=None):
         """Reshape the array `arr` to shape (...,n,n_bin+n_pad)
@@ -319,7 +512,7 @@ class TimeBinner:
         arr : numpy.ndarray
           Input data
         axis : int (default: -1)
-          Axis along which to take variance
+          Axis of the reshaped array along which to take variance
         n_bin : int (default: self.n_bin)
           Override this binner's n_bin.
 
@@ -328,6 +521,15 @@ class TimeBinner:
         out : numpy.ndarray
         """
 
+        # `axis` is that of the reshaped array, the data of each bin is
+        # along its last axis (-1 or arr.ndim)
+        if axis in (-1, arr.ndim) and not np.iscomplexobj(arr):
+            return self._calc_stats(arr, ['var'], n_bin=n_bin
+                                    )[0].astype(np.float32)
+        if _is_dask(arr):
+            return self._map_bins(
+                lambda a: np.nanvar(a, axis=axis, dtype=np.float32), arr,
+                n_bin=n_bin, dtype=np.float32)
         return np.nanvar(self.reshape(arr, n_bin=n_bin), axis=axis, dtype=np.float32)
 
     def std(self, arr, axis=-1, n_bin=None):
@@ -340,7 +542,7 @@ class TimeBinner:
         arr : numpy.ndarray
           Input data
         axis : int (default: -1)
-          Axis along which to take std dev
+          Axis of the reshaped array along which to take std dev
         n_bin : int (default: self.n_bin)
           Override this binner's n_bin.
 
@@ -349,6 +551,15 @@ class TimeBinner:
         out : numpy.ndarray
         """
 
+        # `axis` is that of the reshaped array, the data of each bin is
+        # along its last axis (-1 or arr.ndim)
+        if axis in (-1, arr.ndim) and not np.iscomplexobj(arr):
+            return self._calc_stats(arr, ['std'], n_bin=n_bin
+                                    )[0].astype(np.float32)
+        if _is_dask(arr):
+            return self._map_bins(
+                lambda a: np.nanstd(a, axis=axis, dtype=np.float32), arr,
+                n_bin=n_bin, dtype=np.float32)
         return np.nanstd(self.reshape(arr, n_bin=n_bin), axis=axis, dtype=np.float32)
 
     def calc_psd_base(self, dat, fs=None, window='hann', noise=0,
@@ -394,17 +605,36 @@ class TimeBinner:
         n_fft = self._parse_nfft(n_fft)
         if n_pad is None:
             n_pad = min(n_bin - n_fft, n_fft)
-        out = np.empty(self._outshape_fft(dat.shape, n_fft=n_fft, n_bin=n_bin))
+        dat = self._astype(dat)
+        window = self._window(window, n_fft)
+        if _is_dask(dat):
+            out = self._map_bins(lambda a: psd(a, n_fft, fs, window=window,
+                                               step=step),
+                                 dat, n_pad=n_pad, n_bin=n_bin,
+                                 n_out=int(n_fft // 2),
+                                 dtype=self.dtype or np.float64)
+            return self._subtract_noise(out, noise, fs)
+        out = np.empty(self._outshape_fft(dat.shape, n_fft=n_fft, n_bin=n_bin),
+                       dtype=self.dtype)
         # The data is detrended in psd, so we don't need to do it here.
         dat = self.reshape(dat, n_pad=n_pad)
 
-        for slc in slice1d_along_axis(dat.shape, -1):
-            out[slc] = psd(dat[slc], n_fft, fs,
-                           window=window, step=step)
-        if np.any(noise):
-            out -= noise**2 / (fs/2)
-            # Make sure all values of the PSD are >0 (but still small):
-            out[out < 0] = np.min(np.abs(out)) / 100
+        self._blockwise(lambda a: psd(a, n_fft, fs, window=window,
+                                      step=step), out, dat)
+        return self._subtract_noise(out, noise, fs)
+
+    def _subtract_noise(self, out, noise, fs):
+        """Subtract the white-noise level `noise` from the power spectral
+        densities `out` (in place, unless `out` is a dask array).
+        """
+        if not np.any(noise):
+            return out
+        if _is_dask(out):
+            out = out - noise**2 / (fs/2)
+            return np.where(out < 0, np.min(np.abs(out)) / 100, out)
+        out -= noise**2 / (fs/2)
+        # Make sure all values of the PSD are >0 (but still small):
+        out[out < 0] = np.min(np.abs(out)) / 100
         return out
 
     def calc_csd_base(self, dat1, dat2, fs=None, window='hann',
@@ -453,17 +683,17 @@ class TimeBinner:
         oshp = self._outshape_fft(dat1.shape, n_fft=n_fft, n_bin=n_bin1)
         oshp[-2] = np.min([oshp[-2], int(dat2.shape[-1] // n_bin2)])
 
+        window = self._window(window, n_fft)
         # The data is detrended in psd, so we don't need to do it here:
-        dat1 = self.reshape(dat1, n_pad=n_fft)
-        dat2 = self.reshape(dat2, n_pad=n_fft)
+        dat1 = self.reshape(self._astype(dat1), n_pad=n_fft)
+        dat2 = self.reshape(self._astype(dat2), n_pad=n_fft)
         out = np.empty(oshp, dtype='c{}'.format(dat1.dtype.itemsize * 2))
         if dat1.shape == dat2.shape:
             cross = cpsd
         else:
             cross = cpsd_quasisync
-        for slc in slice1d_along_axis(out.shape, -1):
-            out[slc] = cross(dat1[slc], dat2[slc], n_fft,
-                             fs, window=window)
+        self._blockwise(lambda a, b: cross(a, b, n_fft, fs, window=window),
+                        out, dat1, dat2)
         return out
 
     def calc_freq(self, fs=None, units='rad/s', n_fft=None, coh=False):
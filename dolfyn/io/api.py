@@ -1,4 +1,8 @@
 import numpy as np
+import os
+import glob
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 import scipy.io as sio
 import xarray as xr
 import pkg_resources
@@ -6,6 +10,8 @@ from .nortek import read_nortek
 from .nortek2 import read_signature
 from .rdi import read_rdi
 from .base import _create_dataset, _get_filetype
+from .mat73 import _write_h5mat, _read_h5mat
+from . import cache as _cache
 from ..rotate.base import _set_coords
 from ..time import date2matlab, matlab2date, date2dt64, dt642date, date2epoch, epoch2date
 
@@ -23,6 +29,50 @@ def _check_file_ext(path, ext):
     return path + '.' + ext
 
 
+# Candidate resolutions (finest first, in the variable's units) used to
+# pack variables into 16-bit integers when saving with ``pack=True``.
+# Velocity is recorded by the instruments in 0.1 or 1 mm/s, and Nortek
+# amplitude in 0.5 dB counts. Keys are variable-name prefixes.
+_pack_res = {'vel': [1e-4, 1e-3],
+             'amp': [0.5, 1.],
+             'corr': [1.],
+             'prcnt_gd': [1.]}
+
+
+def _pack_encoding(da):
+    """Returns the CF scale/offset encoding that stores `da` as int16
+    at the instrument resolution, or an empty dict if `da` shouldn't
+    (or can't) be packed.
+
+    The coarsest candidate resolution that represents the data exactly
+    is used. Processed data (e.g. rotated velocity) isn't exactly
+    representable, in which case the finest resolution that fits in
+    the int16 range is used.
+    """
+
+    key = [k for k in _pack_res
+           if da.name == k or da.name.startswith(k + '_')]
+    if not key or da.dtype.kind != 'f':
+        return {}
+
+    vals = da.values[np.isfinite(da.values)]
+    vmax = np.abs(vals).max() if vals.size else 0
+    # Leave room for the fill value
+    fits = [res for res in _pack_res[key[0]]
+            if vmax / res < np.iinfo(np.int16).max]
+    if not fits:
+        return {}
+    scale = fits[0]
+    for res in fits[::-1]:
+        cnt = vals / res
+        if np.all(np.abs(cnt - np.round(cnt)) < 1e-2):
+            scale = res
+            break
+
+    return dict(dtype='int16', scale_factor=scale,
+                _FillValue=np.iinfo(np.int16).min)
+
+
 def _decode_cf(dataset: xr.Dataset) -> xr.Dataset:
     """Wrapper around `xarray.decode_cf()` which handles additional edge cases.
 
@@ -63,7 +113,7 @@ def _decode_cf(dataset: xr.Dataset) -> xr.Dataset:
     return ds
 
 
-def read(fname, userdata=True, nens=None, **kwargs):
+def read(fname, userdata=True, nens=None, cache=False, **kwargs):
     """Read a binary Nortek (e.g., .VEC, .wpr, .ad2cp, etc.) or RDI
     (.000, .PD0, .ENX, etc.) data file.
 
@@ -76,6 +126,10 @@ def read(fname, userdata=True, nens=None, **kwargs):
     nens : None, int or 2-element tuple (start, stop)
       Number of pings or ensembles to read from the file.
       Default is None, read entire file
+    cache : bool or str (default: False)
+      When true, the decoded dataset is stored in (and, if the file
+      hasn't changed, reloaded from) a cache in the user's cache
+      directory. A string specifies the cache directory.
     **kwargs : dict
       Passed to instrument-specific parser.
 
@@ -83,8 +137,23 @@ def read(fname, userdata=True, nens=None, **kwargs):
     -------
     ds : xarray.Dataset
       An xarray dataset from instrument datafile.
+
+    Notes
+    -----
+    Cache entries are identified by the file's path, size, modification
+    time and contents, the DOLfYN version and the reader options
+    (including the userdata.json file). Cached datasets are stored as
+    netCDF files (see :func:`save`), and the least-recently-used entries
+    are removed when the cache grows larger than
+    ``dolfyn.io.cache.max_size`` bytes (default 2 GB). The default
+    cache directory can be set with the ``DOLFYN_CACHE_DIR``
+    environment variable.
     """
 
+    if cache:
+        return _read_cached(fname, cache, userdata=userdata, nens=nens,
+                            **kwargs)
+
     file_type = _get_filetype(fname)
     if file_type == '<GIT-LFS pointer>':
         raise IOError("File '{}' looks like a git-lfs pointer. You may need to "
@@ -103,6 +172,156 @@ def read(fname, userdata=True, nens=None, **kwargs):
     return func(fname, userdata=userdata, nens=nens, **kwargs)
 
 
+def _read_cached(fname, cache, **kwargs):
+    cache_dir = _cache._cache_dir(cache)
+    key = _cache._cache_key(fname, **kwargs)
+    cache_file = _cache._cache_path(cache_dir, key)
+    if os.path.isfile(cache_file):
+        try:
+            ds = load(cache_file)
+        except Exception:
+            # e.g. an entry that is being written by another process
+            pass
+        else:
+            _cache._touch(cache_file)
+            return ds
+
+    ds = read(fname, cache=False, **kwargs)
+
+    tmp_file = _cache._cache_path(
+        cache_dir, '{}-{}.tmp'.format(key, os.getpid()))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # `save` modifies the dataset it is passed
+        save(ds.copy(), tmp_file)
+        os.replace(tmp_file, cache_file)
+        _cache._evict(cache_dir)
+    except Exception as err:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        warnings.warn("Could not write '{}' to the cache directory {}: {}"
+                      .format(fname, cache_dir, err))
+    return ds
+
+
+# Attributes that must match for files to be concatenated by
+# `read_mfdataset`
+_mf_config = ['inst_make', 'inst_model', 'inst_type', 'coord_sys', 'fs',
+              'n_beams', 'n_cells', 'cell_size', 'blank_dist',
+              'beam_angle', 'freq', 'orientation']
+
+
+def _read_mf(args):
+    fname, kwargs = args
+    return read(fname, **kwargs)
+
+
+def _check_mf_config(ds0, ds, fname):
+    for ky in _mf_config:
+        v0, v1 = ds0.attrs.get(ky), ds.attrs.get(ky)
+        if not np.array_equal(v0, v1):
+            raise ValueError("The '{}' attribute of '{}' ({}) does not match "
+                             "the other files ({}).".format(ky, fname, v1, v0))
+    for ky in ds0.coords:
+        if ky.startswith('time'):
+            continue
+        if ky not in ds or not np.array_equal(ds0[ky].values,
+                                              ds[ky].values):
+            raise ValueError("The '{}' coordinate of '{}' does not match "
+                             "the other files.".format(ky, fname))
+
+
+def read_mfdataset(paths, workers=None, userdata=True, **kwargs):
+    """Read a deployment that is split across several binary data files,
+    and concatenate them along time.
+
+    Parameters
+    ----------
+    paths : str or list of str
+      A glob pattern (e.g. 'deployment/*.VEC'), or a list of filenames.
+    workers : int (default: None)
+      The number of processes used to read the files. By default the
+      files are read one at a time.
+    userdata : bool, or string of userdata.json filename (default ``True``)
+      Whether to read the '<base-filename>.userdata.json' file.
+    **kwargs : dict
+      Passed to :func:`read` (e.g. ``cache``) and the instrument-specific
+      parser.
+
+    Returns
+    -------
+    ds : xarray.Dataset
+      An xarray dataset of the concatenated files.
+
+    Notes
+    -----
+    The files are ordered by their first timestamp, and must contain
+    data from the same instrument configuration (the same sampling rate,
+    coordinate system, cell size, etc.). The attributes of the first file
+    are kept.
+
+    Samples at the beginning of a file that overlap the end of the
+    previous file (e.g. files that were written with a small overlap at
+    each rollover) are dropped. Gaps between files are retained, so the
+    time coordinate will not be evenly spaced across a gap.
+    """
+
+    if isinstance(paths, (str, os.PathLike)):
+        fnames = sorted(glob.glob(os.path.expanduser(os.fspath(paths))))
+    else:
+        fnames = [os.fspath(fl) for fl in paths]
+    if not fnames:
+        raise IOError("No files found matching '{}'.".format(paths))
+
+    kwargs['userdata'] = userdata
+    args = [(fl, kwargs) for fl in fnames]
+    if workers is None or workers == 1 or len(fnames) == 1:
+        dss = [_read_mf(arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            dss = list(pool.map(_read_mf, args))
+
+    order = np.argsort([ds['time'].values[0] for ds in dss], kind='stable')
+    dss = [dss[i] for i in order]
+    fnames = [fnames[i] for i in order]
+    for ds, fl in zip(dss[1:], fnames[1:]):
+        _check_mf_config(dss[0], ds, fl)
+    if len(dss) == 1:
+        return dss[0]
+
+    # Datasets may contain several time coordinates (e.g. 'time',
+    # 'time_b5', 'time_echo'), concatenate the variables of each
+    # separately.
+    tdims = [dim for dim in dss[0].dims if dim.startswith('time')]
+    out = dss[0].drop_dims(tdims)
+    for tdim in tdims:
+        names = [ky for ky in dss[0].variables if tdim in dss[0][ky].dims]
+        parts = []
+        tlast = None
+        for ds, fl in zip(dss, fnames):
+            part = ds[names]
+            if tlast is not None:
+                keep = part[tdim].values > tlast
+                if not keep.all():
+                    warnings.warn("Dropping {} samples of '{}' from '{}' that "
+                                  "overlap the previous file."
+                                  .format((~keep).sum(), tdim, fl))
+                    part = part.isel({tdim: keep})
+            if part[tdim].size:
+                tlast = part[tdim].values[-1]
+            parts.append(part)
+        cat = xr.concat(parts, dim=tdim, data_vars='minimal',
+                        coords='minimal', compat='override',
+                        combine_attrs='override')
+        out = out.assign({ky: cat[ky] for ky in cat.data_vars})
+        out = out.assign_coords({ky: cat[ky] for ky in cat.coords
+                                 if tdim in cat[ky].dims})
+    out = out[list(dss[0].variables)]
+    out.attrs = dss[0].attrs
+
+    return out
+
+
 def read_example(name, **kwargs):
     """Read an ADCP or ADV datafile from the examples directory.
 
@@ -133,9 +352,32 @@ def read_example(name, **kwargs):
     return read(filename, **kwargs)
 
 
+def _prepare_save(ds):
+    """Splits complex variables into their real and imaginary parts
+    (listed in the 'complex_vars' attribute, and rejoined by
+    :func:`load`), and casts float64 variables to float32.
+    """
+    # Handling complex values for netCDF4
+    ds.attrs['complex_vars'] = []
+    for var in ds.data_vars:
+        if np.iscomplexobj(ds[var]):
+            ds[var + '_real'] = ds[var].real
+            ds[var + '_imag'] = ds[var].imag
+
+            ds = ds.drop_vars(var)
+            ds.attrs['complex_vars'].append(var)
+
+        # For variables that get rewritten to float64
+        elif ds[var].dtype == np.float64:
+            ds[var] = ds[var].astype('float32')
+
+    return ds
+
+
 def save(ds, filename,
          format='NETCDF4', engine='netcdf4',
          compression=False,
+         pack=False,
          **kwargs):
     """Save xarray dataset as netCDF (.nc).
 
@@ -147,6 +389,11 @@ def save(ds, filename,
       Filename and/or path with the '.nc' extension
     compression : bool (default: False)
       When true, compress all variables with zlib complevel=1.
+    pack : bool (default: False)
+      When true, store velocity, amplitude and correlation variables
+      as 16-bit integers with CF `scale_factor` and `_FillValue`
+      attributes, at the resolution of the instrument. These are
+      unpacked transparently by :func:`load`.
     **kwargs : dict
       These are passed directly to :func:`xarray.Dataset.to_netcdf`
 
@@ -156,6 +403,10 @@ def save(ds, filename,
 
     Rewrites variable encoding dict
 
+    Packed velocity that has been rotated or otherwise processed is
+    rounded to the instrument resolution (0.1 or 1 mm/s). Variables
+    that are already stored as integers are not modified.
+
     More detailed compression options can be specified by specifying
     'encoding' in kwargs. The values in encoding will take precedence
     over whatever is set according to the compression option above.
@@ -164,19 +415,7 @@ def save(ds, filename,
 
     filename = _check_file_ext(filename, 'nc')
 
-    # Handling complex values for netCDF4
-    ds.attrs['complex_vars'] = []
-    for var in ds.data_vars:
-        if np.iscomplexobj(ds[var]):
-            ds[var + '_real'] = ds[var].real
-            ds[var + '_imag'] = ds[var].imag
-
-            ds = ds.drop_vars(var)
-            ds.attrs['complex_vars'].append(var)
-
-        # For variables that get rewritten to float64
-        elif ds[var].dtype == np.float64:
-            ds[var] = ds[var].astype('float32')
+    ds = _prepare_save(ds)
 
     # Write variable encoding
     enc = dict()
@@ -190,6 +429,12 @@ def save(ds, filename,
         params = ['szip', 'zstd', 'bzip2', 'blosc', 'contiguous', 'chunksizes']
         [enc[ky].pop(p) for p in params if p in enc[ky]]
 
+        # Packing from a previously loaded file is redone (or dropped)
+        # according to `pack`
+        if ds[ky].dtype.kind == 'f' and 'scale_factor' in enc[ky]:
+            params = ['dtype', 'scale_factor', 'add_offset', '_FillValue']
+            [enc[ky].pop(p) for p in params if p in enc[ky]]
+
         if compression:
             # New netcdf4-c cannot compress variable length strings
             if ds[ky].size <= 1 or isinstance(ds[ky].data[0], str):
@@ -201,6 +446,11 @@ def save(ds, filename,
     # Fix encoding on datetime64 variables.
     ds = _decode_cf(ds)
 
+    # Set after `_decode_cf`, which removes prior fill values
+    if pack:
+        for ky in ds.data_vars:
+            enc[ky].update(_pack_encoding(ds[ky]))
+
     ds.to_netcdf(filename, format=format, engine=engine, **kwargs)
 
 
@@ -228,6 +478,11 @@ def load(filename):
 
     ds = xr.load_dataset(filename, engine='netcdf4')
 
+    # Integer-packed variables are unpacked by xarray, return them as float32
+    for var in ds.data_vars:
+        if 'scale_factor' in ds[var].encoding and ds[var].dtype == np.float64:
+            ds[var] = ds[var].astype('float32')
+
     # Convert numpy arrays and strings back to lists
     for nm in ds.attrs:
         if isinstance(ds.attrs[nm], np.ndarray) and ds.attrs[nm].size > 1:
@@ -249,7 +504,7 @@ def load(filename):
     return ds
 
 
-def save_mat(ds, filename, datenum=True):
+def save_mat(ds, filename, datenum=True, format='5', compression=False):
     """Save xarray dataset as a MATLAB (.mat) file
 
     Parameters
@@ -261,12 +516,24 @@ def save_mat(ds, filename, datenum=True):
     datenum : bool
       If true, converts time to datenum. If false, time will be saved
       in "epoch time".
+    format : {'5', '7.3'} (default: '5')
+      The MATLAB file format. '7.3' files are HDF5-based, which removes
+      the 2 GB variable size limit of '5' files. They require the
+      `h5py` package.
+    compression : bool (default: False)
+      When true, compress the data variables with gzip. Only used when
+      `format` is '7.3'.
 
     Notes
     -----
     The xarray data format is saved as a MATLAB structure with the fields
     'vars, coords, config, units'. Converts time to datenum
 
+    When `format` is '7.3', each variable is read from `ds` and written
+    to the file in blocks along its last (time) dimension, so datasets
+    that are lazily loaded (e.g. with `xarray.open_dataset`) are not
+    loaded into memory all at once.
+
     See Also
     --------
     scipy.io.savemat()
@@ -281,6 +548,8 @@ def save_mat(ds, filename, datenum=True):
             matfile['standard_name'][key] = ds[key].standard_name
 
     filename = _check_file_ext(filename, 'mat')
+    if format not in ['5', '7.3']:
+        raise ValueError("`format` must be one of '5' or '7.3'")
 
     # Convert time to datenum
     t_coords = [t for t in ds.coords if np.issubdtype(
@@ -307,14 +576,21 @@ def save_mat(ds, filename, datenum=True):
     matfile = {'vars': {}, 'coords': {}, 'config': {},
                'units': {}, 'long_name': {}, 'standard_name': {}}
     for ky in ds.data_vars:
-        matfile['vars'][ky] = ds[ky].values
+        if format == '7.3':
+            # Streamed into the file by `_write_h5mat`
+            matfile['vars'][ky] = ds[ky]
+        else:
+            matfile['vars'][ky] = ds[ky].values
         copy_attrs(matfile, ds, ky)
     for ky in ds.coords:
         matfile['coords'][ky] = ds[ky].values
         copy_attrs(matfile, ds, ky)
     matfile['config'] = ds.attrs
 
-    sio.savemat(filename, matfile)
+    if format == '7.3':
+        _write_h5mat(filename, matfile, compression=compression)
+    else:
+        sio.savemat(filename, matfile)
 
 
 def load_mat(filename, datenum=True):
@@ -336,6 +612,12 @@ def load_mat(filename, datenum=True):
     ds : xarray.Dataset
       An xarray dataset from the binary instrument data.
 
+    Notes
+    -----
+    MATLAB v7.3 files (e.g. from ``save_mat(..., format='7.3')``) are
+    read with `h5py`. Their data variables are loaded lazily, i.e. only
+    when they are accessed.
+
     See Also
     --------
     scipy.io.loadmat()
@@ -343,14 +625,19 @@ def load_mat(filename, datenum=True):
 
     filename = _check_file_ext(filename, 'mat')
 
-    data = sio.loadmat(filename, struct_as_record=False, squeeze_me=True)
+    if sio.matlab.matfile_version(filename)[0] == 2:
+        # MATLAB v7.3 (HDF5) file
+        ds_dict, close = _read_h5mat(filename)
+    else:
+        close = None
+        data = sio.loadmat(filename, struct_as_record=False, squeeze_me=True)
 
-    ds_dict = {'vars': {}, 'coords': {}, 'config': {},
-               'units': {}, 'long_name': {}, 'standard_name': {}}
-    for nm in ds_dict:
-        key_list = data[nm]._fieldnames
-        for ky in key_list:
-            ds_dict[nm][ky] = getattr(data[nm], ky)
+        ds_dict = {'vars': {}, 'coords': {}, 'config': {},
+                   'units': {}, 'long_name': {}, 'standard_name': {}}
+        for nm in ds_dict:
+            key_list = data[nm]._fieldnames
+            for ky in key_list:
+                ds_dict[nm][ky] = getattr(data[nm], ky)
 
     ds_dict['data_vars'] = ds_dict.pop('vars')
     ds_dict['attrs'] = ds_dict.pop('config')
@@ -389,4 +676,7 @@ def load_mat(filename, datenum=True):
             ds[ky].data = dt
         ds.attrs.pop('time_data_vars')
 
+    if close is not None:
+        ds.set_close(close)
+
     return ds
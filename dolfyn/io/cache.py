@@ -0,0 +1,129 @@
+"""A disk cache of decoded instrument files, used by
+:func:`dolfyn.io.api.read` when ``cache`` is set.
+
+Each entry is a netCDF file named by a hash of the raw file (path,
+size, modification time and contents), the DOLfYN version and the
+reader options. Entries are evicted least-recently-used first when the
+total size of the cache exceeds `max_size`.
+"""
+import os
+import sys
+import glob
+import hashlib
+from .._version import __version__
+
+# Maximum total size of the parse cache (bytes)
+max_size = 2 * 1024 ** 3
+
+
+def _user_cache_dir(sub=None):
+    """The DOLfYN directory in the user's cache directory, or the
+    ``DOLFYN_CACHE_DIR`` environment variable if it is set."""
+    if os.environ.get('DOLFYN_CACHE_DIR'):
+        path = os.environ['DOLFYN_CACHE_DIR']
+    elif sys.platform.startswith('win'):
+        path = os.path.join(os.environ.get('LOCALAPPDATA',
+                                           os.path.expanduser('~')),
+                            'dolfyn', 'cache')
+    elif sys.platform == 'darwin':
+        path = os.path.expanduser('~/Library/Caches/dolfyn')
+    else:
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                           os.path.expanduser('~/.cache')),
+                            'dolfyn')
+    if sub is not None:
+        path = os.path.join(path, sub)
+    return path
+
+
+def _cache_dir(cache):
+    """The parse cache directory for the `cache` option of `read`."""
+    if isinstance(cache, (str, os.PathLike)):
+        return os.fspath(cache)
+    return _user_cache_dir('read')
+
+
+def _file_hash(fname, hsh=None, blocksize=2 ** 20):
+    if hsh is None:
+        hsh = hashlib.sha1()
+    with open(fname, 'rb') as fl:
+        for block in iter(lambda: fl.read(blocksize), b''):
+            hsh.update(block)
+    return hsh
+
+
+def _cache_key(fname, userdata=True, nens=None, **kwargs):
+    """Returns the hash that identifies the decoded `fname` for these
+    reader options."""
+    fname = os.path.abspath(os.path.expanduser(fname))
+    stat = os.stat(fname)
+    hsh = hashlib.sha1()
+    hsh.update(repr((fname, stat.st_size, stat.st_mtime_ns, __version__,
+                     userdata, nens, sorted(kwargs.items()))).encode())
+    _file_hash(fname, hsh)
+    # The userdata.json file that would be read by `_find_userdata`
+    if isinstance(userdata, str):
+        jsonfiles = [userdata]
+    elif userdata is True:
+        jsonfiles = [base + '.userdata.json'
+                     for base in [fname.rsplit('.', 1)[0], fname]]
+    else:
+        jsonfiles = []
+    for jsonfile in jsonfiles:
+        if os.path.isfile(jsonfile):
+            _file_hash(jsonfile, hsh)
+            break
+    return hsh.hexdigest()
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.nc')
+
+
+def _cache_files(cache_dir):
+    return [fl for fl in glob.glob(os.path.join(cache_dir, '*.nc'))
+            if not fl.endswith('.tmp.nc')]
+
+
+def _touch(fname):
+    # The modification time of an entry is its last use
+    try:
+        os.utime(fname)
+    except OSError:
+        pass
+
+
+def _evict(cache_dir, size=None):
+    """Remove the least-recently-used entries until the total size of
+    the cache is below `size` (default: `max_size`)."""
+    if size is None:
+        size = max_size
+    files = []
+    for fl in _cache_files(cache_dir):
+        try:
+            stat = os.stat(fl)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, fl))
+    total = sum(f[1] for f in files)
+    for _, nbytes, fl in sorted(files):
+        if total <= size:
+            break
+        try:
+            os.remove(fl)
+        except OSError:
+            continue
+        total -= nbytes
+
+
+def clear_cache(cache=True):
+    """Remove all entries from the parse cache used by
+    :func:`dolfyn.read`.
+
+    Parameters
+    ----------
+    cache : bool or str (default: True)
+      The cache directory, or True for the default directory in the
+      user's cache directory.
+    """
+    _evict(_cache_dir(cache), 0)
@@ -0,0 +1,235 @@
+"""Reading and writing MATLAB v7.3 (HDF5-based) .mat files.
+
+MATLAB stores arrays in column-major order, so every array is written
+with its dimensions reversed (i.e. transposed) in the HDF5 file, and
+structures are stored as HDF5 groups.
+"""
+import numpy as np
+import xarray as xr
+import time as _time
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+
+# Approximate size of the blocks that are read from the dataset and
+# written to the file, and of the HDF5 chunks.
+_block_nbytes = 2 ** 24
+_chunk_nbytes = 2 ** 20
+
+_mat_class = {'f8': 'double', 'f4': 'single',
+              'i1': 'int8', 'i2': 'int16', 'i4': 'int32', 'i8': 'int64',
+              'u1': 'uint8', 'u2': 'uint16', 'u4': 'uint32', 'u8': 'uint64',
+              'b1': 'logical'}
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Reading and writing MATLAB v7.3 files requires "
+                          "the 'h5py' package.")
+    return h5py
+
+
+def _mat_header():
+    """The 128-byte MATLAB header, stored in the HDF5 userblock."""
+    txt = ('MATLAB 7.3 MAT-file, Platform: PCWIN64, Created on: {} '
+           'HDF5 schema 1.00 .'.format(_time.strftime('%a %b %d %H:%M:%S %Y')))
+    return (txt.encode('ascii').ljust(116, b' ') + b' ' * 8 +
+            b'\x00\x02' + b'IM')
+
+
+def _mat_dtype(dtype):
+    """Returns the (storage dtype, MATLAB class) of a numpy dtype."""
+    if dtype.kind == 'c':
+        flt = np.dtype('f{}'.format(dtype.itemsize // 2))
+        return (np.dtype([('real', flt), ('imag', flt)]),
+                _mat_class[flt.str[1:]])
+    if dtype.kind == 'b':
+        return np.dtype('u1'), 'logical'
+    return dtype, _mat_class[dtype.str[1:]]
+
+
+def _to_storage(arr, dtype):
+    """Converts a (python-ordered) block of data to the storage dtype and
+    MATLAB (reversed) dimension order."""
+    if arr.dtype.kind == 'c':
+        out = np.empty(arr.shape, dtype=dtype)
+        out['real'] = arr.real
+        out['imag'] = arr.imag
+        arr = out
+    return np.asarray(arr, dtype=dtype).T
+
+
+def _write_empty(grp, name, mclass='double'):
+    dset = grp.create_dataset(name, data=np.zeros(2, dtype=np.uint64))
+    dset.attrs['MATLAB_class'] = np.bytes_(mclass)
+    dset.attrs['MATLAB_empty'] = np.uint8(1)
+
+
+def _write_value(grp, name, val):
+    """Write a (small) attribute or metadata value to `grp`."""
+    if isinstance(val, (list, tuple)):
+        val = np.array(val)
+    if isinstance(val, np.ndarray) and val.dtype.kind == 'O':
+        # e.g. string coordinates of lazily loaded netCDF files
+        val = val.astype(str)
+    if isinstance(val, (str, np.str_)) or \
+            (isinstance(val, np.ndarray) and val.dtype.kind == 'U'):
+        # Strings are stored as 'char' (padded for string arrays)
+        val = np.atleast_1d(val)
+        if val.size == 0 or val.dtype.itemsize == 0:
+            _write_empty(grp, name, 'char')
+            return
+        val = np.array([[ord(c) for c in s.ljust(val.dtype.itemsize // 4)]
+                        for s in val.ravel()], dtype=np.uint16)
+        dset = grp.create_dataset(name, data=val.T)
+        dset.attrs['MATLAB_class'] = np.bytes_('char')
+        dset.attrs['MATLAB_int_decode'] = np.int32(2)
+        return
+    val = np.asarray(val)
+    if val.size == 0:
+        _write_empty(grp, name)
+        return
+    if val.ndim < 2:
+        # 1D arrays are saved as row vectors, like scipy.io.savemat
+        val = val.reshape((1, -1))
+    dtype, mclass = _mat_dtype(val.dtype)
+    dset = grp.create_dataset(name, data=_to_storage(val, dtype))
+    dset.attrs['MATLAB_class'] = np.bytes_(mclass)
+
+
+def _write_dataarray(grp, name, da, compression=False):
+    """Write the DataArray `da` to `grp`, one block along its last (time)
+    axis at a time, so that lazily loaded data is never held in memory
+    all at once."""
+    if da.dtype.kind in 'UOM' or da.ndim == 0:
+        _write_value(grp, name, da.values)
+        return
+    if da.ndim == 1:
+        da = da.expand_dims('_row')
+    shp = da.shape
+    dtype, mclass = _mat_dtype(da.dtype)
+    n_slc = max(int(np.prod(shp[:-1])) * da.dtype.itemsize, 1)
+    n_block = max(_block_nbytes // n_slc, 1)
+    chunks = None
+    if all(shp):
+        chunks = (min(max(_chunk_nbytes // n_slc, 1), shp[-1]),) + \
+            tuple(shp[:-1][::-1])
+    opts = {}
+    if compression:
+        opts = dict(compression='gzip', compression_opts=4, shuffle=True)
+    dset = grp.create_dataset(name, shape=shp[::-1], dtype=dtype,
+                              chunks=chunks, **opts)
+    dset.attrs['MATLAB_class'] = np.bytes_(mclass)
+    for i0 in range(0, shp[-1], n_block):
+        i1 = min(i0 + n_block, shp[-1])
+        dset[i0:i1] = _to_storage(da[..., i0:i1].values, dtype)
+
+
+def _write_h5mat(filename, matfile, compression=False):
+    """Write the `matfile` structure to the MATLAB v7.3 file `filename`.
+
+    `matfile` is a dictionary of dictionaries (MATLAB structures). Any
+    xarray.DataArray values are streamed to the file.
+    """
+    h5py = _import_h5py()
+    with h5py.File(filename, 'w', userblock_size=512) as fl:
+        for struct in matfile:
+            grp = fl.create_group(struct)
+            grp.attrs['MATLAB_class'] = np.bytes_('struct')
+            for ky, val in matfile[struct].items():
+                if isinstance(val, xr.DataArray):
+                    _write_dataarray(grp, ky, val, compression)
+                else:
+                    _write_value(grp, ky, val)
+    with open(filename, 'r+b') as fl:
+        fl.write(_mat_header())
+
+
+class _MatH5Array(BackendArray):
+    """Lazily indexed (and transposed, squeezed) array backed by an HDF5
+    dataset in a MATLAB v7.3 file."""
+
+    def __init__(self, dset):
+        self.dset = dset
+        self._full_shape = dset.shape[::-1]
+        self.shape = tuple(n for n in self._full_shape if n != 1)
+        self.dtype = _from_storage_dtype(dset)
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.BASIC, self._getitem)
+
+    def _getitem(self, key):
+        key = list(key)
+        full_key = [0 if n == 1 else key.pop(0) for n in self._full_shape]
+        out = self.dset[tuple(full_key[::-1])]
+        return _from_storage(np.asarray(out).T, self.dset)
+
+
+def _from_storage_dtype(dset):
+    if dset.dtype.names == ('real', 'imag'):
+        return np.dtype('c{}'.format(dset.dtype.itemsize))
+    if _attr_str(dset, 'MATLAB_class') == 'logical':
+        return np.dtype(bool)
+    return dset.dtype
+
+
+def _from_storage(arr, dset):
+    if dset.dtype.names == ('real', 'imag'):
+        return arr['real'] + 1j * arr['imag']
+    if _attr_str(dset, 'MATLAB_class') == 'logical':
+        return arr.astype(bool)
+    return arr
+
+
+def _attr_str(dset, name):
+    val = dset.attrs.get(name, b'')
+    if isinstance(val, bytes):
+        val = val.decode('ascii')
+    return val
+
+
+def _read_value(dset):
+    """Read a value from the MATLAB v7.3 file, and 'squeeze' it the
+    same way as ``scipy.io.loadmat(..., squeeze_me=True)``."""
+    mclass = _attr_str(dset, 'MATLAB_class')
+    if dset.attrs.get('MATLAB_empty', 0):
+        if mclass == 'char':
+            return ''
+        return np.empty(0)
+    val = _from_storage(dset[()].T, dset)
+    if mclass == 'char':
+        strs = np.array([''.join(chr(c) for c in row) for row in val])
+        if strs.size == 1:
+            return str(strs[0])
+        return strs
+    val = np.squeeze(val)
+    if val.ndim == 0:
+        return val[()]
+    return val
+
+
+def _read_h5mat(filename):
+    """Read a MATLAB v7.3 file written by `_write_h5mat`.
+
+    Returns a dictionary of dictionaries (MATLAB structures), and the
+    function that closes the file. Variables in the 'vars' structure with
+    more than one element are returned as lazily-loaded arrays, the rest
+    is read into memory.
+    """
+    h5py = _import_h5py()
+    fl = h5py.File(filename, 'r')
+    out = {}
+    for struct in fl:
+        out[struct] = {}
+        for ky, dset in fl[struct].items():
+            if struct == 'vars' and not dset.attrs.get('MATLAB_empty', 0) \
+                    and _attr_str(dset, 'MATLAB_class') != 'char' \
+                    and dset.size > 1:
+                out[struct][ky] = indexing.LazilyIndexedArray(
+                    _MatH5Array(dset))
+            else:
+                out[struct][ky] = _read_value(dset)
+    return out, fl.close
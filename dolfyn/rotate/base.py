@@ -3,6 +3,7 @@ import xarray as xr
 from numpy.linalg import det, inv
 from scipy.spatial.transform import Rotation as R
 import warnings
+import weakref
 
 
 def _make_model(ds):
@@ -25,6 +26,47 @@ def _check_rotmat_det(rotmat, thresh=1e-3):
         rotmat = np.transpose(rotmat)
     return np.abs(det(rotmat) - 1) < thresh
 
+
+# The orientation stacks of the orientation matrices in use, by id.
+# Entries are removed when the orientation matrix is deleted.
+_orient_cache = {}
+_orient_cache_size = 4
+
+
+def _orient_stacks(omat):
+    """Returns the inst->earth and earth->inst rotation matrix stacks
+    (3 x 3 x n_time, C-contiguous) of the orientation matrix `omat`,
+    and whether each matrix is valid (determinant == 1).
+
+    These are calculated once for each `omat` array (for the
+    `_orient_cache_size` most recent ones), and reused by the rotation
+    and motion-correction routines until it is replaced or deleted.
+    Changes made to `omat` in place are not detected.
+    """
+    if 'xarray' in type(omat).__module__:
+        omat = omat.values
+    key = id(omat)
+    if key in _orient_cache:
+        ref, inst2earth, earth2inst, valid = _orient_cache[key]
+        if ref() is omat:
+            if earth2inst is None:
+                earth2inst = omat
+            return inst2earth, earth2inst, valid
+
+    # The transpose of the orientation matrix is the inst->earth
+    # rotation matrix
+    inst2earth = np.ascontiguousarray(np.rollaxis(omat, 1))
+    earth2inst = np.ascontiguousarray(omat)
+    valid = _check_rotmat_det(inst2earth)
+
+    while len(_orient_cache) >= _orient_cache_size:
+        _orient_cache.pop(next(iter(_orient_cache)))
+    # Don't keep `omat` alive
+    _orient_cache[key] = (weakref.ref(omat), inst2earth,
+                          None if earth2inst is omat else earth2inst, valid)
+    weakref.finalize(omat, _orient_cache.pop, key, None)
+    return inst2earth, earth2inst, valid
+
 def _check_rotate_vars(ds, rotate_vars):
     if rotate_vars is None:
         if 'rotate_vars' in ds.attrs:
@@ -290,18 +332,13 @@ def quaternion2orient(quaternions):
     scipy.spatial.transform.Rotation
     """
 
-    omat = type(quaternions)(np.empty((3, 3, quaternions.time.size)))
-    omat = omat.rename({'dim_0': 'earth', 'dim_1': 'inst', 'dim_2': 'time'})
-
-    for i in range(quaternions.time.size):
-        r = R.from_quat([quaternions.isel(q=1, time=i),
-                         quaternions.isel(q=2, time=i),
-                         quaternions.isel(q=3, time=i),
-                         quaternions.isel(q=0, time=i)])
-        omat[..., i] = r.as_matrix()
+    # All at once, with q = [X, Y, Z, W]
+    q = quaternions.isel(q=[1, 2, 3, 0]).transpose('time', 'q').values
+    omat = R.from_quat(q).as_matrix()
 
     # quaternions in inst2earth reference frame, need to rotate to earth2inst
-    omat.values = np.rollaxis(omat.values, 1)
+    omat = xr.DataArray(np.ascontiguousarray(np.transpose(omat, (2, 1, 0))),
+                        dims=['earth', 'inst', 'time'])
 
     earth = xr.DataArray(['E', 'N', 'U'], dims=['earth'], name='earth', attrs={
         'units': '1', 'long_name': 'Earth Reference Frame', 'coverage_content_type': 'coordinate'})
@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 from .vector import _earth2principal
-from .base import _beam2inst, _set_coords, _check_rotate_vars
+from .base import _beam2inst, _set_coords, _check_rotate_vars, _orient_stacks
 
 
 def _inst2earth(adcpo, reverse=False, rotate_vars=None, force=False):
@@ -46,12 +46,8 @@ def _inst2earth(adcpo, reverse=False, rotate_vars=None, force=False):
 
     rotate_vars = _check_rotate_vars(adcpo, rotate_vars)
 
-    # rollaxis gives transpose of orientation matrix.
     # The 'rotation matrix' is the transpose of the 'orientation matrix'
-    # NOTE: the double 'rollaxis' within this function, and here, has
-    # minimal computational impact because np.rollaxis returns a
-    # view (not a new array)
-    rotmat = np.rollaxis(omat.data, 1)
+    rotmat = _orient_stacks(omat)[0]
     if reverse:
         cs_new = 'inst'
         sumstr = 'jik,j...k->i...k'
@@ -61,9 +61,7 @@ def _inst2earth(adcpo, reverse=False, rotate_vars=None, force=False):
 
     # Take the transpose of the orientation to get the inst->earth rotation
     # matrix.
-    rmat = np.rollaxis(omat.data, 1)
-
-    _dcheck = rotb._check_rotmat_det(rmat)
+    rmat, _, _dcheck = rotb._orient_stacks(omat)
     if not _dcheck.all():
         warnings.warn("Invalid orientation matrix (determinant != 1) at indices: {}. "
                       "If rotated, data at these indices will be erroneous."
@@ -69,13 +69,9 @@ def _inst2earth(advo, reverse=False, rotate_vars=None, force=False):
     """
 
     if reverse:  # earth->inst
-        # The transpose of the rotation matrix gives the inverse
-        # rotation, so we simply reverse the order of the einsum:
-        sumstr = 'jik,j...k->i...k'
         cs_now = 'earth'
         cs_new = 'inst'
     else:  # inst->earth
-        sumstr = 'ijk,j...k->i...k'
         cs_now = 'inst'
         cs_new = 'earth'
 
@@ -100,11 +96,11 @@ def _inst2earth(advo, reverse=False, rotate_vars=None, force=False):
         omat = _calc_omat(advo['time'], advo['heading'], advo['pitch'],
                           advo['roll'], orientation_down)
 
-    # Take the transpose of the orientation to get the inst->earth rotation
-    # matrix.
-    rmat = np.rollaxis(omat.data, 1)
+    # The inst->earth rotation matrix is the transpose of the
+    # orientation matrix, and earth->inst is the orientation matrix
+    inst2earth, earth2inst, _dcheck = rotb._orient_stacks(omat)
+    rmat = earth2inst if reverse else inst2earth
 
-    _dcheck = rotb._check_rotmat_det(rmat)
     if not _dcheck.all():
         warnings.warn("Invalid orientation matrix (determinant != 1) at indices: {}. "
                       "If rotated, data at these indices will be erroneous."
@@ -115,7 +111,7 @@ def _inst2earth(advo, reverse=False, rotate_vars=None, force=False):
         if n != 3:
             raise Exception("The entry {} is not a vector, it cannot "
                             "be rotated.".format(nm))
-        advo[nm].values = np.einsum(sumstr, rmat, advo[nm])
+        advo[nm].values = np.einsum('ijk,j...k->i...k', rmat, advo[nm])
 
     advo = rotb._set_coords(advo, cs_new)
 
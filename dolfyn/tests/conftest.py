@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_dir(tmp_path_factory):
+    """Keep the files that DOLfYN caches (e.g. the TE01 integral table)
+    out of the user's cache directory during the tests."""
+    from dolfyn.adv import turbulence
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DOLFYN_CACHE_DIR', str(tmp_path_factory.mktemp('cache')))
+        # A table loaded before the tests were collected
+        mp.setattr(turbulence, '_te01', {})
+        yield
@@ -1,11 +1,13 @@
 from dolfyn.tests import test_read_adp as tr, test_read_adv as tv
 from dolfyn.tests.base import load_netcdf as load, save_netcdf as save, assert_allclose
-from dolfyn import VelBinner, read_example
+from dolfyn import VelBinner, StreamingVelBinner, read_example
 import dolfyn.adv.api as avm
 import dolfyn.adp.api as apm
 from xarray.testing import assert_identical
 import pytest
 import numpy as np
+import xarray as xr
+import os
 
 
 class adv_setup():
@@ -92,6 +94,110 @@ def test_calc_func(make_data=False):
     assert_allclose(ds_adp, load('BenchFile01_func.nc'), atol=1e-6)
 
 
+def test_do_stats():
+    bnr = adv_setup(tv).avg_tool
+    ds = adv_setup(tv).dat1
+
+    out = bnr.do_stats(ds, names=['vel'],
+                       stats=['mean', 'var', 'std', 'min', 'max', 'count'])
+    vel = bnr.reshape(ds['vel'].values)
+
+    np.testing.assert_allclose(out['vel'], np.nanmean(vel, -1), atol=1e-6)
+    np.testing.assert_allclose(out['vel_var'], np.nanvar(vel, -1), atol=1e-6)
+    np.testing.assert_allclose(out['vel_std'], np.nanstd(vel, -1), atol=1e-6)
+    np.testing.assert_allclose(out['vel_min'], np.nanmin(vel, -1))
+    np.testing.assert_allclose(out['vel_max'], np.nanmax(vel, -1))
+    np.testing.assert_equal(out['vel_count'], (~np.isnan(vel)).sum(-1))
+    # `axis` is that of the reshaped array
+    for ax in [2, 1]:
+        np.testing.assert_allclose(bnr.var(ds['vel'].values, axis=ax),
+                                   np.nanvar(vel, ax), atol=1e-6)
+        np.testing.assert_allclose(bnr.std(ds['vel'].values, axis=ax),
+                                   np.nanstd(vel, ax), atol=1e-6)
+
+
+def test_calc_spectra():
+    bnr = adv_setup(tv).avg_tool
+    ds = adv_setup(tv).dat1
+    noise = [0.01, 0.02, 0]
+
+    out = bnr.calc_spectra(ds, freq_units='Hz', noise=noise)
+
+    np.testing.assert_allclose(out['psd'], bnr.calc_psd(
+        ds['vel'], freq_units='Hz', noise=noise), atol=1e-6)
+    for ip, (i1, i2) in enumerate(bnr._cross_pairs):
+        coh = bnr.calc_coh(ds['vel'][i1], ds['vel'][i2])
+        pang = bnr.calc_phase_angle(ds['vel'][i1], ds['vel'][i2])
+        np.testing.assert_allclose(out['coh'][ip], coh, atol=1e-6)
+        np.testing.assert_allclose(out['phase'][ip], pang, atol=1e-6)
+
+
+def test_dask_binner():
+    pytest.importorskip('dask')
+    bnr = adv_setup(tv).avg_tool
+    ds = adv_setup(tv).dat1
+    dsc = ds.chunk({'time': 50})
+
+    out = bnr.do_var(dsc, bnr.do_avg(dsc))
+    assert out['vel'].chunks is not None
+    assert_allclose(out.compute(), bnr.do_var(ds, bnr.do_avg(ds)),
+                    atol=1e-6)
+    for func in [bnr.calc_psd, bnr.calc_tke]:
+        out = func(dsc['vel'], noise=[0.01, 0.02, 0])
+        assert out.chunks is not None
+        np.testing.assert_allclose(out, func(ds['vel'],
+                                             noise=[0.01, 0.02, 0]),
+                                   atol=1e-6)
+
+
+def test_streaming_binner():
+    ds = adv_setup(tv).dat1
+    fs = ds.fs
+    ds = ds.isel(time=slice(0, int(ds.time.size // fs * fs)))
+    bnr = VelBinner(n_bin=fs, fs=fs, n_fft=fs/2)
+    sbnr = StreamingVelBinner(n_bin=fs, fs=fs, n_fft=fs/2)
+
+    outs = []
+    for i0 in range(0, ds.time.size, 37):
+        out = sbnr.push(ds.isel(time=slice(i0, i0 + 37)))
+        if out is not None:
+            outs.append(out)
+    outs.append(sbnr.flush())
+    out = xr.concat(outs, 'time')
+
+    np.testing.assert_allclose(out['psd'], bnr.calc_psd(ds['vel']),
+                               atol=1e-6)
+    np.testing.assert_allclose(out['tke_vec'], bnr.calc_tke(ds['vel']),
+                               atol=1e-6)
+    avg = bnr.do_avg(ds)
+    for nm in out.data_vars:
+        if nm in avg:
+            np.testing.assert_allclose(out[nm], avg[nm], atol=1e-6)
+
+
+def test_binner_float32():
+    ds = adv_setup(tv).dat1
+    bnr = avm.ADVBinner(n_bin=ds.fs, fs=ds.fs)
+    bnr32 = avm.ADVBinner(n_bin=ds.fs, fs=ds.fs, dtype='float32')
+
+    for func in ['calc_psd', 'calc_tke', 'calc_stress', 'calc_csd']:
+        out = getattr(bnr, func)(ds['vel'])
+        out32 = getattr(bnr32, func)(ds['vel'])
+        np.testing.assert_allclose(out32, out, rtol=1e-4, atol=1e-6)
+    out = bnr.calc_spectra(ds)
+    out32 = bnr32.calc_spectra(ds)
+    for nm in out.data_vars:
+        np.testing.assert_allclose(out32[nm], out[nm], rtol=1e-4, atol=1e-6)
+
+
+def test_turbulence_workers():
+    ds = adv_setup(tv).dat1
+    out = avm.calc_turbulence(ds.copy(), n_bin=ds.fs, fs=ds.fs, n_fft=8)
+    out2 = avm.calc_turbulence(ds.copy(), n_bin=ds.fs, fs=ds.fs, n_fft=8,
+                               workers=2)
+    assert_allclose(out2, out, atol=1e-6)
+
+
 def test_calc_freq():
     dat_vec = adv_setup(tv)
 
@@ -133,6 +239,46 @@ def test_adv_turbulence(make_data=False):
     assert_allclose(tdat, load('vector_data01_bin.nc'), atol=1e-6)
 
 
+def test_epsilon_TE01_int():
+    bnr = avm.ADVBinner(n_bin=20.0, fs=16.0)
+    rng = np.random.default_rng(0)
+    I_tke = np.concatenate((rng.uniform(0.01, 4, 201), [4.5, 10, np.nan]))
+    theta = rng.uniform(-np.pi, np.pi, I_tke.size)
+    theta[:20] = rng.uniform(-1e-3, 1e-3, 20)
+    theta[100] = np.nan
+
+    # The integral of each value, as in [TE01]
+    x = np.arange(-20, 20, 1e-2)
+    intgrl = np.array([np.trapz(np.cbrt(x**2 - 2/b*np.cos(t)*x + b**(-2)) *
+                                np.exp(-0.5 * x ** 2), x)
+                       for b, t in zip(I_tke, theta)])
+    intgrl *= (2 * np.pi) ** (-0.5) * I_tke ** (2 / 3)
+
+    out = bnr._calc_epsTE01_int(I_tke.reshape(3, -1), theta.reshape(3, -1))
+    assert out.shape == (3, I_tke.size // 3)
+    assert np.isnan(out.ravel()[[100, -1]]).all()
+    np.testing.assert_allclose(out.ravel(), intgrl, rtol=1e-4)
+
+
+def test_epsilon_TE01_table(tmp_path):
+    from dolfyn.adv import turbulence as turb
+    cache_dir = str(tmp_path)
+    table = turb._te01_table(cache_dir)
+    fname, = os.listdir(cache_dir)
+    assert turb._te01['error'] < turb._te01_rtol
+
+    # Reused
+    mtime = os.path.getmtime(os.path.join(cache_dir, fname))
+    np.testing.assert_equal(turb._te01_table(cache_dir), table)
+    assert os.path.getmtime(os.path.join(cache_dir, fname)) == mtime
+
+    # An invalid table is replaced
+    np.savez(os.path.join(cache_dir, fname), table=table * 2, error=0.)
+    np.testing.assert_equal(turb._te01_table(cache_dir), table)
+    np.testing.assert_equal(np.load(os.path.join(cache_dir, fname))['table'],
+                            table)
+
+
 def test_adcp_turbulence(make_data=False):
     dat = tr.dat_sig_tide.copy(deep=True)
     dat.velds.rotate2('earth')
@@ -3,6 +3,8 @@ from dolfyn.tests import test_read_adp as tp
 from dolfyn.tests.base import load_netcdf as load, save_netcdf as save, assert_allclose
 import dolfyn.adv.api as avm
 import dolfyn.adp.api as apm
+import numpy as np
+import pytest
 
 
 def test_GN2002(make_data=False):
@@ -29,6 +31,108 @@ def test_GN2002(make_data=False):
     assert_allclose(td_imu, load('vector_data_imu01_GN.nc'), atol=1e-6)
 
 
+
+def _phase_space_ref(u):
+    # The original loop of _phaseSpaceThresh, for one window
+    Lu = (2 * np.log(u.size)) ** 0.5
+    u = u - u.mean()
+    du = np.zeros_like(u)
+    d2u = np.zeros_like(u)
+    du[1:-1] = (u[2:] - u[:-2]) / 2
+    d2u[2:-2] = (du[1:-1][2:] - du[1:-1][:-2]) / 2
+    p = (u ** 2 + du ** 2 + d2u ** 2)
+    alpha = np.arctan2(np.sum(u * d2u), np.sum(u ** 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a, b = avm.clean._calcab(alpha, Lu * np.std(u), Lu * np.std(d2u))
+        theta = np.arctan2(du, u)
+        phi = np.arctan2((du ** 2 + u ** 2) ** 0.5, d2u)
+        pe = (((np.sin(phi) * np.cos(theta) * np.cos(alpha) +
+                np.cos(phi) * np.sin(alpha)) ** 2) / a +
+              ((np.sin(phi) * np.cos(theta) * np.sin(alpha) -
+                np.cos(phi) * np.cos(alpha)) ** 2) / b +
+              ((np.sin(phi) * np.sin(theta)) ** 2) /
+              (Lu * np.std(du)) ** 2) ** -1
+    if np.isnan(pe[0]):
+        pe[:] = 0
+    return p > pe
+
+
+def test_GN2002_degenerate():
+    rng = np.random.default_rng(0)
+    npt = 5
+    # Windows with an undefined threshold (e.g. a std of 0), and random
+    # ones, including short ones such as those between NaN gaps
+    u = np.stack([np.arange(npt, dtype=float), np.linspace(0.1, 0.7, npt),
+                  np.ones(npt), [0, 0, 1, 0, 0], [0, 1, 0, 1, 0]] +
+                 [rng.standard_normal(npt) for i in range(50)], axis=1)
+    for n in [3, 4, npt]:
+        mask = avm.clean._phaseSpaceThresh(u[:n])
+        ref = np.stack([_phase_space_ref(col) for col in u[:n].T], axis=1)
+        np.testing.assert_equal(mask, ref)
+    assert mask[:, 0].any()
+
+
+def test_GN2002_streaming():
+    vel = tv.dat.vel.fillna(0).values
+    vel = vel[..., :(vel.shape[-1] // 20) * 20]
+
+    def despike(npt, step, n_chunk):
+        despiker = avm.clean.StreamingGN2002(npt=npt, step=step)
+        mask = [despiker.push(vel[..., i:i + n_chunk])
+                for i in range(0, vel.shape[-1], n_chunk)]
+        mask.append(despiker.flush())
+        return np.concatenate(mask, axis=-1)
+
+    # Non-overlapping windows are those of GN2002
+    np.testing.assert_equal(despike(20, 20, 33),
+                            avm.clean.GN2002(vel, npt=20))
+    # The mask doesn't depend on the chunks
+    np.testing.assert_equal(despike(20, None, 7),
+                            despike(20, None, vel.shape[-1]))
+
+
+def test_clean_fill_block():
+    td = tv.dat.copy(deep=True)
+    mask = np.zeros(td.vel.shape, dtype='bool')
+    mask[:, 10::37] = True
+    mask[:, 100:110] = True
+
+    # With `npt` larger than the distance between bad points, they are
+    # all interpolated over as one block
+    for method in ['linear', 'cubic', 'pchip']:
+        vel = td.vel.copy()
+        vel.values[mask] = np.nan
+        ref = vel.interpolate_na(dim='time', method=method,
+                                 use_coordinate=True, limit=6)
+        out = avm.clean.clean_fill(td.vel.copy(), mask, npt=40,
+                                   method=method, maxgap=6)
+        np.testing.assert_allclose(out, ref, rtol=1e-6)
+
+
+def test_fill_nan_ensemble_mean_dask():
+    pytest.importorskip('dask')
+    td = tv.dat.copy(deep=True)
+    mask = np.zeros(td.vel.shape, dtype='bool')
+    mask[:, 5::7] = True
+    vel = td.vel.values.copy()
+
+    out = avm.clean.fill_nan_ensemble_mean(td.vel.chunk({'time': 100}),
+                                           mask, fs=1, window=45)
+    assert out.chunks is not None
+    ref = avm.clean.fill_nan_ensemble_mean(td.vel, mask, fs=1, window=45)
+    np.testing.assert_allclose(out, ref, rtol=1e-6)
+    # The input is left unmodified, unless inplace=True
+    np.testing.assert_equal(td.vel.values, vel)
+    # The window must be a whole number of points
+    np.testing.assert_allclose(avm.clean.fill_nan_ensemble_mean(
+        td.vel, mask, fs=0.1, window=450), ref, rtol=1e-6)
+    with pytest.raises(ValueError):
+        avm.clean.fill_nan_ensemble_mean(td.vel, mask, fs=1.5, window=31)
+    avm.clean.fill_nan_ensemble_mean(td.vel, mask, fs=1, window=45,
+                                     inplace=True)
+    np.testing.assert_allclose(td.vel, ref, rtol=1e-6)
+
+
 def test_spike_thresh(make_data=False):
     td = tv.dat_imu.copy(deep=True)
 
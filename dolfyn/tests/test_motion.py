@@ -55,6 +55,19 @@ def test_motion_adv(make_data=False):
     assert_allclose(tdmj, load('vector_data_imu01-json_mc.nc'), atol=1e-7)
 
 
+def test_motion_chunked():
+    tdm = avm.correct_motion(tv.dat_imu)
+    tdmc = avm.correct_motion(tv.dat_imu, chunk_size=1000)
+    tdmd = avm.correct_motion(tv.dat_imu, chunk_size=1000,
+                              diagnostics=False)
+
+    for nm in ['vel_raw', 'velrot', 'velacc', 'acclow']:
+        assert nm not in tdmd
+        assert nm not in tdmd.rotate_vars
+    xr.testing.assert_allclose(tdmd['vel'], tdm['vel'], atol=1e-5)
+    assert_allclose(tdmc, tdm, atol=1e-5)
+
+
 def test_sep_probes(make_data=False):
     tdm = tv.dat_imu.copy(deep=True)
     tdm = avm.correct_motion(tdm, separate_probes=True)
@@ -74,6 +87,9 @@ def test_duty_cycle():
     # with duty cycle code
     td = correct_motion(tdc, accel_filtfreq=0.03, to_earth=False)
     td_ENU = correct_motion(tdc, accel_filtfreq=0.03, to_earth=True)
+    # in chunks of whole bursts
+    td_chunk = correct_motion(tdc, accel_filtfreq=0.03, to_earth=False,
+                              chunk_size=120)
 
     # Wrapped function
     n_burst = 50
@@ -89,4 +105,5 @@ def test_duty_cycle():
     cd_ENU = cd.velds.rotate2('earth', inplace=False)
 
     assert_allclose(td, cd, atol=1e-7)
+    assert_allclose(td_chunk, td, atol=1e-7)
     assert_allclose(td_ENU, cd_ENU, atol=1e-7)
@@ -1,6 +1,7 @@
 import numpy as np
 from numpy.testing import assert_allclose
 from dolfyn.rotate.base import euler2orient, orient2euler, quaternion2orient
+from dolfyn.rotate import base as rotb
 from dolfyn.rotate.api import set_declination
 from dolfyn.tests.base import load_netcdf as load
 
@@ -76,6 +77,27 @@ def test_hpr_defs():
                          [0, 0, 1], ])
 
 
+def test_orient_stacks():
+    h, p, r = np.meshgrid(np.arange(0, 360, 30), np.arange(-80, 90, 20),
+                          np.arange(-170, 180, 20))
+    omat = euler2orient(h.ravel(), p.ravel(), r.ravel())
+    omat[..., 0] *= 2  # invalid
+
+    inst2earth, earth2inst, valid = rotb._orient_stacks(omat)
+    assert_allclose(inst2earth, np.rollaxis(omat, 1))
+    assert_allclose(earth2inst, omat)
+    assert inst2earth.flags['C_CONTIGUOUS']
+    assert earth2inst.flags['C_CONTIGUOUS']
+    assert not valid[0] and valid[1:].all()
+
+    # Reused for the same array, and removed with it
+    assert rotb._orient_stacks(omat)[0] is inst2earth
+    assert rotb._orient_stacks(omat.copy())[0] is not inst2earth
+    key = id(omat)
+    del omat, earth2inst
+    assert key not in rotb._orient_cache
+
+
 def test_pr_declination():
     # Test to confirm that pitch and roll don't change when you set
     # declination
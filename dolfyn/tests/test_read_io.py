@@ -2,7 +2,9 @@ import dolfyn.io.rdi as wh
 import dolfyn.io.nortek as awac
 import dolfyn.io.nortek2 as sig
 from dolfyn.io.api import read_example as read
-from dolfyn.tests.base import assert_allclose, save_netcdf, \
+from dolfyn.io.api import read_mfdataset
+from dolfyn.io.cache import clear_cache
+from dolfyn.tests.base import assert_allclose, save_netcdf, load_netcdf, \
     save_matlab, load_matlab, exdt, rfnm
 from dolfyn.tests import test_read_adp as tp
 from dolfyn.tests import test_read_adv as tv
@@ -27,6 +29,98 @@ def test_save():
     os.remove(rfnm('test_save.mat'))
 
 
+def test_save_pack():
+    ds = tv.dat.copy(deep=True)
+    save_netcdf(ds, 'test_save_pack', pack=True)
+    ds2 = load_netcdf('test_save_pack.nc')
+
+    assert ds2['vel'].encoding['dtype'] == 'int16'
+    assert ds2['vel'].dtype == 'float32'
+    assert_allclose(ds, ds2, atol=1e-6)
+
+    os.remove(rfnm('test_save_pack.nc'))
+
+
+def test_save_mat73():
+    ds = tv.dat.copy(deep=True)
+    save_matlab(ds, 'test_save73', format='7.3', compression=True)
+    ds2 = load_matlab('test_save73.mat')
+
+    assert_allclose(ds, ds2, atol=1e-6)
+
+    ds2.close()
+    os.remove(rfnm('test_save73.mat'))
+
+
+def test_read_cache(tmp_path):
+    cache_dir = str(tmp_path)
+    td = read('vector_data01.VEC', nens=100, cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    td2 = read('vector_data01.VEC', nens=100, cache=cache_dir)
+    assert_allclose(td, td2, atol=1e-6)
+
+    read('vector_data01.VEC', nens=50, cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+    clear_cache(cache_dir)
+    assert len(os.listdir(cache_dir)) == 0
+
+
+def test_read_mfdataset():
+    td = read('RDI_test01.000')
+    fname = exdt('RDI_test01.000')
+    # The second file entirely overlaps the first
+    with pytest.warns(UserWarning, match='overlap'):
+        td2 = read_mfdataset([fname, fname], workers=2)
+    assert_allclose(td, td2, atol=1e-6)
+
+
+
+
+def test_read_mfdataset_pieces(tmp_path, monkeypatch):
+    import dolfyn.io.api as api
+    td = read('vector_data01.VEC', nens=100)
+    # Each "file" is a piece of the record
+    pieces = {}
+
+    def read_piece(args):
+        return td.isel(time=pieces[args[0]]).copy(deep=True)
+    monkeypatch.setattr(api, '_read_mf', read_piece)
+
+    for slc in [(slice(0, 60), slice(40, 100)),  # Partial overlap
+                (slice(0, 50), slice(50, 100))]:  # No overlap
+        pieces = {str(tmp_path / 'a.VEC'): slc[0],
+                  str(tmp_path / 'b.VEC'): slc[1]}
+        # The files are sorted by their first timestamp
+        fnames = sorted(pieces, reverse=True)
+        if slc[0].stop > slc[1].start:
+            with pytest.warns(UserWarning, match='Dropping 20 samples'):
+                td2 = read_mfdataset(fnames)
+        else:
+            td2 = read_mfdataset(fnames)
+        assert_allclose(td2, td.copy(deep=True), atol=1e-6)
+
+def test_convert_up_to_date(tmp_path):
+    import importlib.util
+    from importlib.machinery import SourceFileLoader
+    script = os.path.join(os.path.dirname(__file__), '..', '..', 'scripts',
+                          'dolfyn-convert')
+    if not os.path.isfile(script):
+        pytest.skip("dolfyn-convert script not found")
+    loader = SourceFileLoader('dolfyn_convert', script)
+    convert = importlib.util.module_from_spec(
+        importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(convert)
+
+    fnm, outnm = str(tmp_path / 'data.VEC'), str(tmp_path / 'data.nc')
+    open(fnm, 'wb').close()
+    assert not convert.up_to_date(fnm, outnm, None)
+    open(outnm, 'wb').close()
+    assert convert.up_to_date(fnm, outnm, None)
+    assert convert.up_to_date(fnm, outnm, {'status': 'converted'})
+    # The output of a failed conversion is converted again
+    assert not convert.up_to_date(fnm, outnm, {'status': 'failed'})
+
 def test_matlab_io(make_data=False):
     nens = 100
     td_vec = read('vector_data_imu01.VEC', nens=nens)
@@ -1,5 +1,9 @@
 import dolfyn.tools.misc as tools
+import dolfyn.tools.psd as psd
+import dolfyn.tools.fft as fft
+import dolfyn
 from numpy.testing import assert_equal, assert_allclose
+from scipy.signal import detrend
 import unittest
 import numpy as np
 
@@ -95,3 +99,65 @@ class tools_testcase(unittest.TestCase):
         out = np.array([90., 89., 88., 87., 86., 85., 84., 83., 82., 81.])
 
         assert_allclose(d, out, atol=1e-10)
+
+    def test_psd_nd(self):
+        rng = np.random.default_rng(0)
+        a = rng.standard_normal((2, 1000))
+        b = np.roll(a, 3, axis=-1) + 0.3 * rng.standard_normal((2, 1000))
+
+        with psd.fft_cache():
+            d1 = psd.cpsd(a, b, 100, 10)
+            d2 = psd.coherence(a, b, 100)
+            d3 = psd.phase_angle(a, b, 100)
+        for i in range(2):
+            assert_allclose(d1[i], psd.cpsd(a[i], b[i], 100, 10), atol=1e-12)
+            assert_allclose(d2[i], psd.coherence(a[i], b[i], 100), atol=1e-12)
+            assert_allclose(d3[i], psd.phase_angle(a[i], b[i], 100),
+                            atol=1e-12)
+        # Phase of a signal with itself
+        assert_allclose(psd.phase_angle(a, a, 100), np.ones((2, 50)),
+                        atol=1e-12)
+        assert_allclose(psd.psd(a, 100, 10), np.abs(psd.cpsd(a, a, 100, 10)),
+                        atol=1e-12)
+        # A shorter `b` is split into as many segments as `a`
+        c = b[..., :700]
+        window = psd._getwindow('hann', 100)
+        ang = 0
+        for i, j in zip(range(0, 901, 47), range(0, 601, 31)):
+            s1 = np.fft.rfft(detrend(a[..., i:i + 100]) * window)[..., 1:]
+            s2 = np.fft.rfft(detrend(c[..., j:j + 100]) * window)[..., 1:]
+            ang += s2 / np.abs(s2) / (s1 / np.abs(s1)) / 20
+        assert_allclose(psd.phase_angle(a, c, 100), ang, atol=1e-12)
+
+    def test_fft_backend(self):
+        rng = np.random.default_rng(0)
+        a = rng.standard_normal((3, 1000))
+        d1 = psd.psd(a, 100, 10)
+        dolfyn.set_fft_backend('scipy', workers=2)
+        try:
+            assert_equal(fft.get_fft_backend(), ('scipy', 2))
+            d2 = psd.psd(a, 100, 10)
+        finally:
+            dolfyn.set_fft_backend('numpy')
+        assert_allclose(d1, d2, atol=1e-12)
+        self.assertRaises(ValueError, dolfyn.set_fft_backend, 'numpy', 4)
+
+    def test_psd_float32(self):
+        rng = np.random.default_rng(0)
+        a = rng.standard_normal((3, 1000))
+        window = np.hanning(100).astype(np.float32)
+        d1 = psd.psd(a, 100, 10)
+        d2 = psd.psd(a.astype(np.float32), 100, 10, window=window)
+        assert_equal(d2.dtype, np.float32)
+        assert_equal(fft.rfft(a.astype(np.float32)).dtype, np.complex64)
+        assert_allclose(d1, d2, rtol=1e-4)
+
+    def test_correlate(self):
+        rng = np.random.default_rng(0)
+        a = rng.standard_normal((3, 137))
+        v = rng.standard_normal((3, 100))
+        out = fft.correlate(a, v)
+        assert_equal(out.shape, (3, 38))
+        for i in range(3):
+            assert_allclose(out[i], np.correlate(a[i], v[i], 'valid'),
+                            atol=1e-10)
@@ -0,0 +1,105 @@
+"""The FFT library used by |dlfn|'s spectral functions.
+"""
+import numpy as np
+
+_backend = {'name': 'numpy', 'module': np.fft, 'kwargs': {}}
+
+
+def set_fft_backend(backend='numpy', workers=None):
+    """Set the FFT library used by the spectral functions of |dlfn|
+    (:mod:`dolfyn.tools.psd` and the binning tools).
+
+    Parameters
+    ----------
+    backend : str {'numpy' (default), 'scipy', 'pyfftw'}
+      The FFT library to use. 'pyfftw' requires the `pyFFTW` package.
+    workers : int (default: None)
+      The number of threads used by each transform ('scipy' and 'pyfftw'
+      only). Negative values count back from the number of CPUs, so
+      ``workers=-1`` uses all of them.
+
+    Notes
+    -----
+    Transforms of many segments at once (e.g. all the segments of a
+    binned dataset) are split between the `workers`.
+
+    scipy and numpy cache the FFT plan of recently used transform sizes
+    (e.g. a binner's `n_fft`). For 'pyfftw', this function enables the
+    pyFFTW interface cache so that the (more expensive) FFTW plans are
+    also reused.
+
+    Examples
+    --------
+    >>> dolfyn.set_fft_backend('scipy', workers=-1)
+    """
+
+    backend = backend.lower()
+    if backend == 'numpy':
+        if workers not in [None, 1]:
+            raise ValueError("The 'numpy' FFT backend does not support "
+                             "multiple workers.")
+        module = np.fft
+        kwargs = {}
+    elif backend == 'scipy':
+        import scipy.fft as module
+        kwargs = {'workers': workers}
+    elif backend == 'pyfftw':
+        try:
+            import pyfftw
+            import pyfftw.interfaces.scipy_fft as module
+        except ImportError:
+            raise ImportError("The 'pyfftw' FFT backend requires the "
+                              "'pyFFTW' package.")
+        pyfftw.interfaces.cache.enable()
+        kwargs = {'workers': workers}
+    else:
+        raise ValueError("Unsupported FFT backend: {}. Valid backends are "
+                         "'numpy', 'scipy' and 'pyfftw'.".format(backend))
+
+    _backend.update(name=backend, module=module, kwargs=kwargs)
+
+
+def get_fft_backend():
+    """Returns the name of the FFT library in use, and its number of
+    workers.
+    """
+    return _backend['name'], _backend['kwargs'].get('workers', None)
+
+
+def rfft(a, n=None, axis=-1):
+    """The real-input FFT of `a`, using the current FFT backend.
+
+    The output is complex64 for float32 input. The 'numpy' backend
+    calculates it in double precision regardless, the others in single
+    precision.
+    """
+    out = _backend['module'].rfft(a, n=n, axis=axis, **_backend['kwargs'])
+    if np.asarray(a).dtype == np.float32:
+        out = out.astype(np.complex64, copy=False)
+    return out
+
+
+def irfft(a, n=None, axis=-1):
+    """The inverse of :func:`rfft`, using the current FFT backend.
+
+    The output is float32 for complex64 input.
+    """
+    out = _backend['module'].irfft(a, n=n, axis=axis, **_backend['kwargs'])
+    if np.asarray(a).dtype == np.complex64:
+        out = out.astype(np.float32, copy=False)
+    return out
+
+
+def correlate(a, v):
+    """The 'valid' cross-correlation of `a` and `v` along their last axis
+    (i.e. ``np.correlate(a, v, 'valid')`` for each 1D slice), calculated
+    with FFTs of all the slices at once.
+
+    The last axis of `a` must be at least as long as that of `v`. The
+    other axes of `a` and `v` must broadcast against each other.
+    """
+    from scipy.fft import next_fast_len
+    n_a, n_v = a.shape[-1], v.shape[-1]
+    n = next_fast_len(n_a, real=True)
+    out = irfft(rfft(a, n=n) * rfft(v, n=n).conj(), n=n)
+    return out[..., :n_a - n_v + 1]
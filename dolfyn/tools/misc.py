@@ -22,7 +22,7 @@ def _find(arr):
     return np.nonzero(np.ravel(arr))[0]
 
 
-def detrend(arr, axis=-1, in_place=False):
+def detrend(arr, axis=-1, in_place=False, dtype=None):
     """Remove a linear trend from arr.
 
     Parameters
@@ -31,6 +31,8 @@ def detrend(arr, axis=-1, in_place=False):
        The array from which to remove a linear trend.
     axis : int
        The axis along which to operate.
+    dtype : numpy.dtype (default: float64)
+       The precision in which the trend is calculated.
 
     Notes
     -----
@@ -46,7 +48,7 @@ def detrend(arr, axis=-1, in_place=False):
         arr = arr.copy()
     sz = np.ones(arr.ndim, dtype=int)
     sz[axis] = arr.shape[axis]
-    x = np.arange(sz[axis], dtype=np.float_).reshape(sz)
+    x = np.arange(sz[axis], dtype=dtype or np.float_).reshape(sz)
     x -= np.nanmean(x, axis=axis, keepdims=True)
     arr -= np.nanmean(arr, axis=axis, keepdims=True)
     b = np.nanmean((x * arr), axis=axis, keepdims=True) / \
@@ -1,6 +1,10 @@
 import numpy as np
+from contextlib import contextmanager
 from .misc import detrend
-fft = np.fft.fft
+from . import fft as _fft
+
+# Segment ffts that are reused within a `fft_cache` context
+_fft_cache = None
 
 
 def psd_freq(nfft, fs, full=False):
@@ -86,6 +90,68 @@ def stepsize(l, nfft, nens=None, step=None):
         return int((l - nfft) / (nens - 1)), int(nens), int(nfft)
 
 
+def _segments(a, nfft, step, nens):
+    """Returns a (strided, read-only) view of the overlapping `nfft`-point
+    segments of `a` along its last axis, with shape (..., n_seg, nfft)."""
+    if nens == 1:
+        return a[..., None, :nfft]
+    return np.lib.stride_tricks.sliding_window_view(
+        a, nfft, axis=-1)[..., ::step, :]
+
+
+def _fft_segments(a, nfft, window, step, nens):
+    """The fft (positive frequencies only) of the detrended, windowed
+    segments of `a`, with shape (..., n_seg, nfft // 2).
+
+    The segments are detrended and transformed in single precision if
+    both `a` and `window` are float32, and in double precision otherwise.
+    """
+    if nens == 1:
+        step = 0
+    if _fft_cache is not None:
+        key = (id(a), nfft, step, window.tobytes())
+        if key in _fft_cache and _fft_cache[key][0] is a:
+            return _fft_cache[key][1]
+    segs = detrend(_segments(a, nfft, step, nens), axis=-1,
+                   dtype=np.result_type(a.dtype, window.dtype))
+    out = _fft.rfft(segs * window, axis=-1)[..., 1:int(nfft / 2. + 1)]
+    if _fft_cache is not None:
+        # Keep a reference to `a`, so that its id isn't reused
+        _fft_cache[key] = (a, out)
+    return out
+
+
+@contextmanager
+def fft_cache():
+    """A context in which the segment ffts of each input array are
+    computed only once, and reused by :func:`psd`, :func:`cpsd`,
+    :func:`cpsd_quasisync`, :func:`coherence` and :func:`phase_angle`.
+
+    For example, this computes the ffts of `u` and `v` once (rather than
+    six times)::
+
+        with fft_cache():
+            Suu = psd(u, nfft, fs)
+            Suv = cpsd(u, v, nfft, fs)
+            Cuv = coherence(u, v, nfft)
+
+    Notes
+    -----
+    Arrays are identified by the array object (not its values), and are
+    held in memory until the context exits, so they should not be
+    modified in-place within the context.
+    """
+    global _fft_cache
+    outer = _fft_cache
+    if outer is None:
+        _fft_cache = {}
+    try:
+        yield
+    finally:
+        if outer is None:
+            _fft_cache = None
+
+
 def coherence(a, b, nfft, window='hann', debias=True, noise=(0, 0)):
     """Computes the magnitude-squared coherence of `a` and `b`.
 
@@ -125,7 +191,8 @@ def coherence(a, b, nfft, window='hann', debias=True, noise=(0, 0)):
     and auto spectral densities of the signal `a` and `b`.
     """
 
-    l = [len(a), len(b)]
+    a, b = np.asarray(a), np.asarray(b)
+    l = [a.shape[-1], b.shape[-1]]
     cross = cpsd_quasisync
     if l[0] == l[1]:
         cross = cpsd
@@ -142,10 +209,13 @@ def coherence(a, b, nfft, window='hann', debias=True, noise=(0, 0)):
         raise Exception("Coherence must be computed from a set of ensembles.")
     # fs=1 is ok because it comes out in the normalization.  (noise
     # normalization depends on this)
-    out = ((np.abs(cross(a, b, nfft, 1, window=window)) ** 2) /
-           ((psd(a, nfft, 1, window=window, step=step1) - noise[0] ** 2 / np.pi) *
-            (psd(b, nfft, 1, window=window, step=step2) - noise[1] ** 2 / np.pi))
-           )
+    with fft_cache():
+        # The segment ffts of `a` and `b` are shared by the cross- and
+        # auto-spectra
+        out = ((np.abs(cross(a, b, nfft, 1, window=window)) ** 2) /
+               ((psd(a, nfft, 1, window=window, step=step1) - noise[0] ** 2 / np.pi) *
+                (psd(b, nfft, 1, window=window, step=step2) - noise[1] ** 2 / np.pi))
+               )
     if debias:
         # This is from Benignus1969, it seems to work (make data with different
         # nens (nfft) agree).
@@ -210,9 +280,10 @@ def cpsd_quasisync(a, b, nfft, fs, window='hann'):
     `b`, divided by the units of fs.
     """
 
+    a, b = np.asarray(a), np.asarray(b)
     if np.iscomplexobj(a) or np.iscomplexobj(b):
         raise Exception("Velocity cannot be complex")
-    l = [len(a), len(b)]
+    l = [a.shape[-1], b.shape[-1]]
     if l[0] == l[1]:
         return cpsd(a, b, nfft, fs, window=window)
     elif l[0] > l[1]:
@@ -223,15 +294,12 @@ def cpsd_quasisync(a, b, nfft, fs, window='hann'):
     step[1], nens, nfft = stepsize(l[1], nfft, nens=nens)
     fs = np.float64(fs)
     window = _getwindow(window, nfft)
-    fft_inds = slice(1, int(nfft / 2. + 1))
     wght = 2. / (window ** 2).sum()
-    pwr = fft(detrend(a[0:nfft]) * window)[fft_inds] * \
-        np.conj(fft(detrend(b[0:nfft]) * window)[fft_inds])
-    if nens - 1:
-        for i1, i2 in zip(range(step[0], l[0] - nfft + 1, step[0]),
-                          range(step[1], l[1] - nfft + 1, step[1])):
-            pwr += fft(detrend(a[i1:(i1 + nfft)]) * window)[fft_inds] * \
-                np.conj(fft(detrend(b[i2:(i2 + nfft)]) * window)[fft_inds])
+    s1 = _fft_segments(a, nfft, window, step[0], nens)
+    s2 = _fft_segments(b, nfft, window, step[1], nens)
+    # Pairs of segments that start at the same relative position
+    n_seg = min(s1.shape[-2], s2.shape[-2])
+    pwr = (s1[..., :n_seg, :] * np.conj(s2[..., :n_seg, :])).sum(-2)
     pwr *= wght / nens / fs
     return pwr
 
@@ -294,30 +362,23 @@ def cpsd(a, b, nfft, fs, window='hann', step=None):
     `b`, divided by the units of fs.
     """
 
-    if np.iscomplexobj(a) or np.iscomplexobj(b):
-        raise Exception("Velocity cannot be complex")
     auto_psd = False
     if a is b:
         auto_psd = True
-    l = len(a)
+    a, b = np.asarray(a), np.asarray(b)
+    if np.iscomplexobj(a) or np.iscomplexobj(b):
+        raise Exception("Velocity cannot be complex")
+    l = a.shape[-1]
     step, nens, nfft = stepsize(l, nfft, step=step)
     fs = np.float64(fs)
     window = _getwindow(window, nfft)
-    fft_inds = slice(1, int(nfft / 2. + 1))
     wght = 2. / (window ** 2).sum()
-    s1 = fft(detrend(a[0:nfft]) * window)[fft_inds]
+    s1 = _fft_segments(a, nfft, window, step, nens)
     if auto_psd:
-        pwr = np.abs(s1) ** 2
+        pwr = (s1.real ** 2 + s1.imag ** 2).sum(-2)
     else:
-        pwr = s1 * np.conj(fft(detrend(b[0:nfft]) * window)[fft_inds])
-    if nens - 1:
-        for i in range(step, l - nfft + 1, step):
-            s1 = fft(detrend(a[i:(i + nfft)]) * window)[fft_inds]
-            if auto_psd:
-                pwr += np.abs(s1) ** 2
-            else:
-                pwr += s1 * \
-                    np.conj(fft(detrend(b[i:(i + nfft)]) * window)[fft_inds])
+        s2 = _fft_segments(b, nfft, window, step, nens)
+        pwr = (s1 * np.conj(s2)).sum(-2)
     pwr *= wght / nens / fs
     return pwr
 
@@ -333,7 +394,8 @@ def psd(a, nfft, fs, window='hann', step=None):
     Parameters
     ----------
     a : |np.ndarray|
-      The first signal, as a 1D vector
+      The signal. N-dimensional arrays are processed along their last
+      axis.
     nfft : int
       The number of points in the fft.
     fs : float
@@ -354,13 +416,16 @@ def psd(a, nfft, fs, window='hann', step=None):
     Returns
     -------
     psd : |np.ndarray|
-      The power spectral density of `a` and `b`.
+      The power spectral density of `a`, with shape (..., nfft // 2).
 
     Notes
     -----
     Credit: This function's line of code was copied from JN's fast_psd.m 
     routine.
 
+    All of the overlapping segments (of every 1D slice of `a`) are
+    detrended and transformed at once.
+
     See Also
     --------
     :func:`cpsd`
@@ -368,7 +433,8 @@ def psd(a, nfft, fs, window='hann', step=None):
     `numpy.fft`
     """
 
-    return np.abs(cpsd(a, a, nfft, fs, window=window, step=step))
+    a = np.asarray(a)
+    return cpsd(a, a, nfft, fs, window=window, step=step)
 
 
 def phase_angle(a, b, nfft, window='hann', step=None):
@@ -389,7 +455,11 @@ def phase_angle(a, b, nfft, window='hann', step=None):
 
     Parameters
     ----------
-    a      : 1d-array_like, the signal. Currently only supports vectors.
+    a      : array_like, the first signal (N-dimensional arrays are
+             processed along their last axis).
+    b      : array_like, the second signal. If it is a different length
+             than `a`, it is split into the same number of segments,
+             which are paired with those of `a` in order.
     nfft   : The number of points in the fft.
     window : The window to use (default: 'hann'). Valid entries are:
                  None,1               : uses a 'boxcar' or ones window.
@@ -414,21 +484,18 @@ def phase_angle(a, b, nfft, window='hann', step=None):
     :func:`cpsd`
     """
 
+    a, b = np.asarray(a), np.asarray(b)
+    l = [a.shape[-1], b.shape[-1]]
+    step = [step, step]
+    step[0], nens, nfft = stepsize(l[0], nfft, step=step[0])
+    if l[1] != l[0]:
+        # `b` is split into the same number of segments as `a`
+        step[1] = stepsize(l[1], nfft, nens=nens)[0]
+    else:
+        step[1] = step[0]
     window = _getwindow(window, nfft)
-    fft_inds = slice(1, int(nfft / 2. + 1))
-    s1 = fft(detrend(a[0:nfft]) * window)[fft_inds]
-    s2 = fft(detrend(b[0:nfft]) * window)[fft_inds]
-    s1 /= np.abs(s1)
-    s2 /= np.abs(s2)
-    ang = s2 / s1
-    l = len(a)
-    step, nens, nfft = stepsize(l, nfft, step=step)
-    if nens - 1:
-        for i in range(step, l - nfft + 1, step):
-            s1 = fft(detrend(a[i:(i + nfft)]) * window)[fft_inds]
-            s1 /= np.abs(s1)
-            s2 = fft(detrend(a[i:(i + nfft)]) * window)[fft_inds]
-            s2 /= np.abs(s2)
-            ang += s2 / s1
+    s1 = _fft_segments(a, nfft, window, step[0], nens)[..., :nens, :]
+    s2 = _fft_segments(b, nfft, window, step[1], nens)[..., :nens, :]
+    ang = (s2 / np.abs(s2) / (s1 / np.abs(s1))).sum(-2)
     ang /= nens
     return ang
@@ -1,11 +1,12 @@
 import numpy as np
 import xarray as xr
-from .binned import TimeBinner
-from .time import dt642epoch, dt642date
+from .binned import TimeBinner, _block_size, _is_dask
+from .time import dt642epoch, dt642date, epoch2dt64
 from .rotate.api import rotate2, set_declination, set_inst2head_rotmat
 from .io.api import save
-from .tools.psd import coherence, phase_angle
-from .tools.misc import slice1d_along_axis, convert_degrees
+from .tools.psd import coherence, phase_angle, psd, cpsd, fft_cache
+from .tools.misc import convert_degrees
+from .tools.fft import correlate
 
 
 @xr.register_dataset_accessor('velds')  # 'velocity dataset'
@@ -465,6 +466,18 @@ class VelBinner(TimeBinner):
 
         # This computes the basic averages
         avg = binner.do_avg(rawdat)
+
+    Datasets that are too large to fit in memory can be opened with
+    dask (e.g. ``xarray.open_dataset(filename, chunks={'time': 2**20})``).
+    `do_avg`, `do_var`, `calc_psd` and `calc_tke` then return lazy
+    (dask-backed) output, which is calculated one chunk at a time when
+    it is computed or saved. The chunks are aligned to the bins, and
+    `n_bin` must be an integer.
+
+    ``VelBinner(..., dtype='float32')`` calculates the spectra,
+    covariances and turbulence statistics in single precision, which
+    uses half the memory (see also :func:`dolfyn.set_fft_backend`, the
+    'numpy' backend always calculates ffts in double precision).
     """
 
     # This defines how cross-spectra and stresses are computed.
@@ -532,40 +545,14 @@ class VelBinner(TimeBinner):
         AttributeError.
         """
 
-        out_ds = self._check_ds(raw_ds, out_ds)
-
-        if names is None:
-            names = raw_ds.data_vars
-
-        for ky in names:
-            # set up dimensions and coordinates for Dataset
-            dims_list = raw_ds[ky].dims
-            if any([ar for ar in dims_list if 'altraw' in ar]):
-                continue
-            coords_dict = {}
-            for nm in dims_list:
-                if 'time' in nm:
-                    coords_dict[nm] = self.mean(raw_ds[ky][nm].values)
-                else:
-                    coords_dict[nm] = raw_ds[ky][nm].values
-
-            # create Dataset
-            if 'ensemble' not in ky:
-                try:  # variables with time coordinate
-                    out_ds[ky] = xr.DataArray(self.mean(raw_ds[ky].values),
-                                              coords=coords_dict,
-                                              dims=dims_list,
-                                              attrs=raw_ds[ky].attrs
-                                              ).astype('float32')
-                except:  # variables not needing averaging
-                    pass
-            # Add standard deviation
-            std = self.std(raw_ds.velds.U_mag.values)
-            out_ds['U_std'] = xr.DataArray(
-                std.astype('float32'),
-                dims=raw_ds.vel.dims[1:],
-                attrs={'units': 'm s-1',
-                       'long_name': 'Water Velocity Standard Deviation'})
+        out_ds = self._do_stats(raw_ds, out_ds, names, {'mean': ''})
+        # Add standard deviation
+        std = self.std(raw_ds.velds.U_mag.data)
+        out_ds['U_std'] = xr.DataArray(
+            std.astype('float32'),
+            dims=raw_ds.vel.dims[1:],
+            attrs={'units': 'm s-1',
+                   'long_name': 'Water Velocity Standard Deviation'})
 
         return out_ds
 
@@ -604,13 +591,65 @@ class VelBinner(TimeBinner):
         AttributeError.
         """
 
+        return self._do_stats(raw_ds, out_ds, names, {'var': suffix})
+
+    def do_stats(self, raw_ds, out_ds=None, names=None,
+                 stats=['mean', 'var']):
+        """Bin the dataset and calculate several statistics of each
+        variable at once.
+
+        Parameters
+        ----------
+        raw_ds : xarray.Dataset
+           The raw data structure to be binned.
+        out_ds : xarray.Dataset
+           The binned (output) dataset to which the statistics are added.
+        names : list of strings
+           The names of variables of which to calculate statistics. If
+           `names` is None, all data in `raw_ds` will be binned.
+        stats : list of strings
+           The statistics to calculate, any of 'mean', 'var', 'std',
+           'min', 'max' and 'count' (the number of non-NaN values).
+
+        Returns
+        -------
+        out_ds : xarray.Dataset
+          The new (or updated when out_ds is not None) dataset with the
+          statistics of all the variables in raw_ds. The mean of each
+          variable has the name of the variable (as in `do_avg`), and
+          the others have the name of the statistic appended (e.g.
+          'vel_var', as in `do_var`).
+
+        Raises
+        ------
+        AttributeError : when out_ds is supplied as input (not None)
+        and the values in out_ds.attrs are inconsistent with
+        raw_ds.attrs or the properties of this VelBinner (n_bin,
+        n_fft, fs, etc.)
+
+        Notes
+        -----
+        All of the statistics of a variable are calculated in a single
+        pass through its data, in float64 precision. They are returned
+        as float32.
+        """
+
+        return self._do_stats(raw_ds, out_ds, names,
+                              {nm: '' if nm == 'mean' else '_' + nm
+                               for nm in stats})
+
+    def _do_stats(self, raw_ds, out_ds, names, stats):
+        """Add the statistics of the variables `names` of `raw_ds` to
+        `out_ds`, where `stats` is a dictionary of the statistics and the
+        suffix of their output variables."""
+
         out_ds = self._check_ds(raw_ds, out_ds)
 
         if names is None:
             names = raw_ds.data_vars
 
         for ky in names:
-            # set up dimensions and coordinates for dataarray
+            # set up dimensions and coordinates for Dataset
             dims_list = raw_ds[ky].dims
             if any([ar for ar in dims_list if 'altraw' in ar]):
                 continue
@@ -624,11 +663,17 @@ class VelBinner(TimeBinner):
             # create Dataset
             if 'ensemble' not in ky:
                 try:  # variables with time coordinate
-                    out_ds[ky+suffix] = xr.DataArray(self.var(raw_ds[ky].values),
-                                                     coords=coords_dict,
-                                                     dims=dims_list,
-                                                     attrs=raw_ds[ky].attrs
-                                                     ).astype('float32')
+                    dat = raw_ds[ky].data
+                    if np.iscomplexobj(dat):
+                        vals = [getattr(self, nm)(dat) for nm in stats]
+                    else:
+                        vals = self._calc_stats(dat, list(stats))
+                    for nm, val in zip(stats, vals):
+                        out_ds[ky + stats[nm]] = xr.DataArray(
+                            val,
+                            coords=coords_dict,
+                            dims=dims_list,
+                            attrs=raw_ds[ky].attrs).astype('float32')
                 except:  # variables not needing averaging
                     pass
 
@@ -673,13 +718,14 @@ class VelBinner(TimeBinner):
             raise Exception(
                 "veldat1 is shorter than veldat2. Please switch these inputs.")
 
-        dat1 = veldat1.values
-        dat2 = veldat2.values
+        dat1 = self._astype(veldat1.values)
+        dat2 = self._astype(veldat2.values)
 
         if n_fft_coh is None:
             n_fft = self.n_fft_coh
         else:
             n_fft = int(n_fft_coh)
+        window = self._window(window, n_fft)
 
         # want each slice to carry the same timespan
         n_bin2 = self._parse_nbin(n_bin)  # bins for shorter array
@@ -693,10 +739,9 @@ class VelBinner(TimeBinner):
         dat1 = self.reshape(dat1, n_pad=n_fft, n_bin=n_bin1)
         dat2 = self.reshape(dat2, n_pad=n_fft, n_bin=n_bin2)
 
-        for slc in slice1d_along_axis(out.shape, -1):
-            out[slc] = coherence(dat1[slc], dat2[slc], n_fft,
-                                 window=window, debias=debias,
-                                 noise=noise)
+        self._blockwise(lambda a, b: coherence(a, b, n_fft, window=window,
+                                               debias=debias, noise=noise),
+                        out, dat1, dat2)
 
         freq = self.calc_freq(self.fs, units='Hz', coh=True)
 
@@ -749,13 +794,14 @@ class VelBinner(TimeBinner):
             raise Exception(
                 "veldat1 is shorter than veldat2. Please switch these inputs.")
 
-        dat1 = veldat1.values
-        dat2 = veldat2.values
+        dat1 = self._astype(veldat1.values)
+        dat2 = self._astype(veldat2.values)
 
         if n_fft_coh is None:
             n_fft = self.n_fft_coh
         else:
             n_fft = int(n_fft_coh)
+        window = self._window(window, n_fft)
 
         # want each slice to carry the same timespan
         n_bin2 = self._parse_nbin(n_bin)  # bins for shorter array
@@ -769,10 +815,8 @@ class VelBinner(TimeBinner):
         dat2 = self.reshape(dat2, n_pad=n_fft, n_bin=n_bin2)
         out = np.empty(oshp, dtype='c{}'.format(dat2.dtype.itemsize * 2))
 
-        for slc in slice1d_along_axis(out.shape, -1):
-            # PSD's are computed in radian units:
-            out[slc] = phase_angle(dat1[slc], dat2[slc], n_fft,
-                                   window=window)
+        self._blockwise(lambda a, b: phase_angle(a, b, n_fft, window=window),
+                        out, dat1, dat2)
 
         freq = self.calc_freq(self.fs, units='Hz', coh=True)
 
@@ -815,7 +859,7 @@ class VelBinner(TimeBinner):
         This has the advantage that the 0 index is actually zero-lag.
         """
 
-        indat = veldat.values
+        indat = self._astype(veldat.values)
 
         n_bin = self._parse_nbin(n_bin)
         out = np.empty(self._outshape(indat.shape, n_bin=n_bin)[:-1] +
@@ -825,19 +869,18 @@ class VelBinner(TimeBinner):
         dt1 = dt1 - dt1[..., :, int(n_bin // 4):
                         int(-n_bin // 4)].mean(-1)[..., None]
         dt2 = self.demean(indat)
+        # Correlate all the bins (and components) at once
+        tmp = np.empty(dt2.shape[:-1] + (dt1.shape[-1] - dt2.shape[-1] + 1,),
+                       dtype=np.result_type(dt1.dtype, dt2.dtype))
+        self._blockwise(correlate, tmp, dt1, dt2)
         se = slice(int(n_bin // 4) - 1, None, 1)
         sb = slice(int(n_bin // 4) - 1, None, -1)
-        for slc in slice1d_along_axis(dt1.shape, -1):
-            tmp = np.correlate(dt1[slc], dt2[slc], 'valid')
-            # The zero-padding in reshape means we compute coherence
-            # from one-sided time-series for first and last points.
-            if slc[-2] == 0:
-                out[slc] = tmp[se]
-            elif slc[-2] == dt2.shape[-2] - 1:
-                out[slc] = tmp[sb]
-            else:
-                # For the others we take the average of the two sides.
-                out[slc] = (tmp[se] + tmp[sb]) / 2
+        # For most bins we take the average of the two sides.
+        out[:] = (tmp[..., se] + tmp[..., sb]) / 2
+        # The zero-padding in reshape means we compute coherence
+        # from one-sided time-series for first and last points.
+        out[..., -1, :] = tmp[..., -1, sb]
+        out[..., 0, :] = tmp[..., 0, se]
 
         dims_list, coords_dict = self._new_coords(veldat)
         # tack on new coordinate
@@ -880,8 +923,8 @@ class VelBinner(TimeBinner):
         The two velocity inputs must be the same length
         """
 
-        dat1 = veldat1.values
-        dat2 = veldat2.values
+        dat1 = self._astype(veldat1.values)
+        dat2 = self._astype(veldat2.values)
 
         # want each slice to carry the same timespan
         n_bin2 = self._parse_nbin(n_bin)
@@ -901,8 +944,7 @@ class VelBinner(TimeBinner):
         # Don't need to pad the second variable:
         dt2 = self.demean(dat2, n_bin=n_bin2)
 
-        for slc in slice1d_along_axis(shp, -1):
-            out[slc] = np.correlate(dt1[slc], dt2[slc], 'valid')
+        self._blockwise(correlate, out, dt1, dt2)
         if normed:
             out /= (self.std(dat1, n_bin=n_bin1)[..., :shp[-2]] *
                     self.std(dat2, n_bin=n_bin2)[..., :shp[-2]] *
@@ -993,7 +1035,7 @@ class VelBinner(TimeBinner):
         """
 
         if 'xarray' in type(veldat).__module__:
-            vel = veldat.values
+            vel = self._astype(veldat.data)
         if 'xarray' in type(noise).__module__:
             noise = noise.values
 
@@ -1088,7 +1130,7 @@ class VelBinner(TimeBinner):
         fs_in = self._parse_fs(fs)
         n_fft = self._parse_nfft(n_fft)
         if 'xarray' in type(veldat).__module__:
-            vel = veldat.values
+            vel = veldat.data
         if 'xarray' in type(noise).__module__:
             noise = noise.values
         if ("rad" not in freq_units) and ("Hz" not in freq_units):
@@ -1122,17 +1164,28 @@ class VelBinner(TimeBinner):
             else:
                 noise = np.array([0, 0, 0])
 
-            out = np.empty(self._outshape_fft(vel[:3].shape, n_fft=n_fft, n_bin=n_bin),
-                           dtype=np.float32)
-            for idx in range(3):
-                out[idx] = self.calc_psd_base(vel[idx],
-                                              fs=fs,
-                                              noise=noise[idx],
-                                              window=window,
-                                              n_bin=n_bin,
-                                              n_pad=n_pad,
-                                              n_fft=n_fft,
-                                              step=step)
+            if _is_dask(vel):
+                out = np.stack([self.calc_psd_base(vel[idx],
+                                                   fs=fs,
+                                                   noise=noise[idx],
+                                                   window=window,
+                                                   n_bin=n_bin,
+                                                   n_pad=n_pad,
+                                                   n_fft=n_fft,
+                                                   step=step)
+                                for idx in range(3)])
+            else:
+                out = np.empty(self._outshape_fft(vel[:3].shape, n_fft=n_fft, n_bin=n_bin),
+                               dtype=np.float32)
+                for idx in range(3):
+                    out[idx] = self.calc_psd_base(vel[idx],
+                                                  fs=fs,
+                                                  noise=noise[idx],
+                                                  window=window,
+                                                  n_bin=n_bin,
+                                                  n_pad=n_pad,
+                                                  n_fft=n_fft,
+                                                  step=step)
             coords = {'S': self.S,
                       'time': self.mean(veldat['time'].values),
                       'freq': freq}
@@ -1162,3 +1215,429 @@ class VelBinner(TimeBinner):
             attrs={'units': units,
                    'n_fft': n_fft,
                    'long_name': 'Power Spectral Density'})
+
+    def calc_spectra(self, veldat, outputs=('psd', 'csd', 'coh', 'phase'),
+                     freq_units='rad/s', window='hann', noise=None,
+                     debias=True, n_fft=None, n_fft_coh=None):
+        """Calculate the auto-spectra, cross-spectra, coherence and phase
+        of the velocity components at once, from shared segment ffts.
+
+        Parameters
+        ----------
+        veldat : xarray.Dataset or xarray.DataArray
+          The raw dataset (its 'vel' variable is used) or the raw 3D
+          velocity data (of dims 'dir' and 'time').
+        outputs : sequence of str
+          The spectra to calculate (default: all), any of:
+          - 'psd'   : power spectral density (see :meth:`calc_psd`)
+          - 'csd'   : cross-spectral density (see
+            :meth:`ADVBinner.calc_csd <dolfyn.adv.turbulence.ADVBinner.calc_csd>`)
+          - 'coh'   : coherence (see :meth:`calc_coh`)
+          - 'phase' : phase angle (see :meth:`calc_phase_angle`)
+        freq_units : string
+          Frequency units of the returned spectra in either Hz or rad/s
+          (`f` or :math:`\\omega`)
+        window : string or array
+          Specify the window function.
+          Options: 1, None, 'hann', 'hamm'
+        noise : numeric
+          Instrument noise level in same units as velocity, subtracted
+          from the auto-spectra. Default: [0, 0, 0].
+        debias : bool (default: True)
+          Specify whether to debias the coherence according to
+          Benignus1969.
+        n_fft : int (optional)
+          The fft size of the auto-spectra (default: from the binner).
+        n_fft_coh : int (optional)
+          The fft size of the cross-spectra, coherence and phase
+          (default: n_fft_coh from the binner).
+
+        Returns
+        -------
+        ds : xarray.Dataset
+          Dataset containing the `outputs`. The auto-spectra are along the
+          'S' (Sxx, Syy, Szz) dimension, and the others along the 'C'
+          (Cxy, Cxz, Cyz) dimension.
+
+        Notes
+        -----
+        The values are the same as those of the individual functions, but
+        the windowed ffts of each velocity component are only computed
+        once for all of the cross-spectra, coherence and phase (and also
+        for the auto-spectra when they use the same segments, i.e. when
+        ``n_fft == n_fft_coh`` and ``n_bin >= 2 * n_fft``).
+        """
+
+        for nm in outputs:
+            if nm not in ['psd', 'csd', 'coh', 'phase']:
+                raise ValueError("Invalid output '{}'. Valid outputs are "
+                                 "'psd', 'csd', 'coh' and 'phase'.".format(nm))
+        if isinstance(veldat, xr.Dataset):
+            veldat = veldat['vel']
+        fs_in = self._parse_fs()
+        n_fft = self._parse_nfft(n_fft)
+        n_fft_coh = self._parse_nfft_coh(n_fft_coh)
+        time = self.mean(veldat.time.values)
+        vel = veldat.values
+        if vel.ndim != 2 or vel.shape[0] < 3:
+            raise ValueError("This function is only valid for the 3D "
+                             "velocity vector from an ADV.")
+        vel = self._astype(vel[:3])
+        if noise is None:
+            noise = np.array([0, 0, 0])
+        if 'xarray' in type(noise).__module__:
+            noise = noise.values
+        if np.size(noise) != 3:
+            raise ValueError('Noise is expected to be an array of 3 scalars')
+
+        if 'rad' in freq_units:
+            fs = 2*np.pi*fs_in
+            freq_units = 'rad s-1'
+            units = 'm2 s-1 rad-1'
+        else:
+            fs = fs_in
+            freq_units = 'Hz'
+            units = 'm2 s-2 Hz-1'
+
+        # Reshaped data, as in `calc_psd` and `calc_csd_base`/`calc_coh`
+        dat_coh = self.reshape(vel, n_pad=n_fft_coh)
+        dat_psd = dat_coh
+        n_pad = min(self.n_bin - n_fft, n_fft)
+        if 'psd' in outputs and (n_fft != n_fft_coh or n_pad != n_fft_coh):
+            dat_psd = self.reshape(vel, n_pad=n_pad)
+        n_time = dat_coh.shape[-2]
+
+        out = {}
+        if 'psd' in outputs:
+            out['psd'] = np.empty((3, n_time, int(n_fft // 2)),
+                                  dtype=self.dtype)
+        if 'csd' in outputs:
+            out['csd'] = np.empty((3, n_time, int(n_fft_coh // 2)),
+                                  dtype=self._cdtype)
+        if 'coh' in outputs:
+            out['coh'] = np.empty((3, n_time, int(n_fft_coh // 2)),
+                                  dtype=vel.dtype)
+        if 'phase' in outputs:
+            out['phase'] = np.empty((3, n_time, int(n_fft_coh // 2)),
+                                    dtype='c{}'.format(vel.dtype.itemsize * 2))
+
+        win_psd = self._window(window, n_fft)
+        win_coh = self._window(window, n_fft_coh)
+        n_blk = max(_block_size // (3 * dat_coh.shape[-1]), 1)
+        for i0 in range(0, n_time, n_blk):
+            slc = slice(i0, i0 + n_blk)
+            # These arrays identify the segment ffts in the cache, so
+            # each block of each component is only sliced once
+            dc = [dat_coh[idx, slc] for idx in range(3)]
+            if dat_psd is dat_coh:
+                dp = dc
+            else:
+                dp = [dat_psd[idx, slc] for idx in range(3)]
+            with fft_cache():
+                if 'psd' in outputs:
+                    for idx in range(3):
+                        out['psd'][idx, slc] = psd(dp[idx], n_fft, fs,
+                                                   window=win_psd)
+                for ip, (i1, i2) in enumerate(self._cross_pairs):
+                    if 'csd' in outputs:
+                        out['csd'][ip, slc] = cpsd(dc[i1], dc[i2], n_fft_coh,
+                                                   fs, window=win_coh)
+                    if 'coh' in outputs:
+                        out['coh'][ip, slc] = coherence(
+                            dc[i1], dc[i2], n_fft_coh, window=win_coh,
+                            debias=debias)
+                    if 'phase' in outputs:
+                        out['phase'][ip, slc] = phase_angle(
+                            dc[i1], dc[i2], n_fft_coh, window=win_coh)
+
+        ds = xr.Dataset()
+        if 'psd' in outputs:
+            dat = out['psd']
+            for idx in range(3):
+                if np.any(noise[idx]):
+                    dat[idx] -= noise[idx]**2 / (fs/2)
+                    # Make sure all values of the PSD are >0 (but still small):
+                    dat[idx][dat[idx] < 0] = np.min(np.abs(dat[idx])) / 100
+            freq = xr.DataArray(self.calc_freq(fs=fs_in, units=freq_units, n_fft=n_fft),
+                                dims=['freq'],
+                                name='freq',
+                                attrs={'units': freq_units,
+                                       'long_name': 'FFT Frequency Vector',
+                                       'coverage_content_type': 'coordinate'}
+                                ).astype('float32')
+            ds['psd'] = xr.DataArray(dat.astype('float32'),
+                                     coords={'S': self.S,
+                                             'time': time,
+                                             'freq': freq},
+                                     dims=['S', 'time', 'freq'],
+                                     attrs={'units': units,
+                                            'n_fft': n_fft,
+                                            'long_name': 'Power Spectral Density'})
+        coh_freq = xr.DataArray(self.calc_freq(fs=fs_in, units=freq_units, n_fft=n_fft_coh),
+                                dims=['coh_freq'],
+                                name='coh_freq',
+                                attrs={'units': freq_units,
+                                       'long_name': 'FFT Frequency Vector',
+                                       'coverage_content_type': 'coordinate'}
+                                ).astype('float32')
+        coords = {'C': self.C, 'time': time, 'coh_freq': coh_freq}
+        dims = ['C', 'time', 'coh_freq']
+        if 'csd' in outputs:
+            ds['csd'] = xr.DataArray(out['csd'].astype('complex64'),
+                                     coords=coords, dims=dims,
+                                     attrs={'units': units,
+                                            'n_fft_coh': n_fft_coh,
+                                            'long_name': 'Cross Spectral Density'})
+        if 'coh' in outputs:
+            ds['coh'] = xr.DataArray(out['coh'].astype('float32'),
+                                     coords=coords, dims=dims,
+                                     attrs={'units': '1',
+                                            'n_fft_coh': n_fft_coh,
+                                            'long_name': 'Coherence'})
+        if 'phase' in outputs:
+            ds['phase'] = xr.DataArray(out['phase'],
+                                       coords=coords, dims=dims,
+                                       attrs={'units': '1',
+                                              'n_fft_coh': n_fft_coh,
+                                              'long_name': 'Phase Angle'})
+
+        return ds
+
+
+class StreamingVelBinner(VelBinner):
+    """A binning tool for data that arrives in pieces (e.g. real-time
+    data), which calculates the averages, TKE and spectra of each bin as
+    soon as it is complete.
+
+    Parameters
+    ----------
+    n_bin : int
+      Number of data points to include in a 'bin' (ensemble), not the
+      number of bins
+    fs : int
+      Instrument sampling frequency in Hz
+    n_fft : int
+      Number of data points to use for fft (`n_fft`<=`n_bin`).
+      Default: `n_fft`=`n_bin`
+    n_fft_coh : int
+      Number of data points to use for coherence and cross-spectra ffts
+      Default: `n_fft_coh`=`n_fft`
+    noise : float, list or numpy.ndarray
+      Instrument's doppler noise in same units as velocity, subtracted
+      from the TKE and spectra.
+    freq_units : string
+      Frequency units of the spectra in either Hz or rad/s
+      (default: 'rad/s').
+    window : string or array
+      The window function of the spectra (default: 'hann').
+    dtype : str or numpy.dtype (default: None)
+      The precision of the calculations (see :class:`VelBinner`).
+
+    Examples
+    ========
+    Data is passed to the binner with `push`, which returns the bins
+    that were completed by that data (or None)::
+
+        binner = dolfyn.StreamingVelBinner(n_bin=9600, fs=16, n_fft=2048)
+        for raw in data_stream:
+            out = binner.push(raw)
+            if out is not None:
+                ...
+        # The last complete bin(s)
+        out = binner.flush()
+
+    Notes
+    -----
+    Only the incomplete bin, and the overlap with the previous bin that
+    is needed by the spectra (see `n_pad` of :meth:`calc_psd_base
+    <dolfyn.binned.TimeBinner.calc_psd_base>`), are kept in memory
+    between calls to `push`. A bin is complete (and output) once the
+    data that overlaps with the next bin, `n_pad` // 2 points, has also
+    been received.
+
+    The output is the same as that of `do_avg` (without the variables
+    of other time dimensions), `calc_tke` and `calc_psd` for the full
+    dataset, with two exceptions:
+
+    - If the data continues past the last complete bin, the spectra of
+      that bin differ. `calc_psd` drops the incomplete bin and pads the
+      overlap with zeros, whereas the streaming spectra use the data
+      that follows. Only when the data ends with the last complete bin
+      (or within `n_pad` // 2 points of it) are both zero-padded.
+    - If there is noise, the negative values of the spectra are
+      replaced by the smallest value of the bins output at the same
+      time, rather than of the full dataset.
+    """
+
+    def __init__(self, n_bin, fs, n_fft=None, n_fft_coh=None,
+                 noise=[0, 0, 0], freq_units='rad/s', window='hann',
+                 dtype=None):
+        if np.mod(n_bin, 1) != 0:
+            raise ValueError("`StreamingVelBinner` requires an integer "
+                             "`n_bin`.")
+        if ("rad" not in freq_units) and ("Hz" not in freq_units):
+            raise ValueError("`freq_units` should be one of 'Hz' or 'rad/s'")
+        super().__init__(int(n_bin), fs, n_fft=n_fft, n_fft_coh=n_fft_coh,
+                         noise=noise, dtype=dtype)
+        self.freq_units = freq_units
+        self.window = window
+        self.n_pad = int(min(self.n_bin - self.n_fft, self.n_fft))
+        self.reset()
+
+    def reset(self):
+        """Discard the buffered data, e.g. before pushing data that does
+        not follow on from the previous data.
+        """
+        self._buf = None
+        self._vars = None
+        self._attrs = None
+
+    def push(self, raw_ds):
+        """Add the next chunk of data, of any length, to the binner.
+
+        Parameters
+        ----------
+        raw_ds : xarray.Dataset
+          The raw data that follows the previously pushed data.
+
+        Returns
+        -------
+        out_ds : xarray.Dataset or None
+          The averages, TKE ('tke_vec') and spectra ('psd') of the bins
+          that were completed by `raw_ds`, or None if there are none.
+        """
+
+        if raw_ds['time'].size == 0:
+            return None
+        self._attrs = self._check_ds(raw_ds, None).attrs
+        names = [ky for ky in raw_ds.data_vars
+                 if raw_ds[ky].dims[-1:] == ('time', ) and
+                 'ensemble' not in ky]
+        if self._buf is None:
+            # Zeros before the first bin, as in `reshape`
+            npd0 = self.n_pad // 2
+            self._vars = {}
+            self._buf = {'time': np.zeros(npd0)}
+            for ky in names:
+                da = raw_ds[ky]
+                self._vars[ky] = (da.dims,
+                                  {nm: da[nm].values for nm in da.dims
+                                   if nm != 'time'},
+                                  da.attrs)
+                self._buf[ky] = np.zeros(da.shape[:-1] + (npd0, ),
+                                         dtype=da.dtype)
+        buf = {'time': np.concatenate([self._buf['time'],
+                                       dt642epoch(raw_ds['time'].values)])}
+        for ky in self._vars:
+            buf[ky] = np.concatenate([self._buf[ky], raw_ds[ky].values],
+                                     axis=-1)
+        n = (buf['time'].size - self.n_pad) // self.n_bin
+        n = max(n, 0)
+        # Keep the rest (and the overlap) for the next bins
+        self._buf = {ky: val[..., n * self.n_bin:].copy()
+                     for ky, val in buf.items()}
+        if n == 0:
+            return None
+        return self._calc_bins(buf, n)
+
+    def flush(self):
+        """Output the complete bins that have not been output yet (for
+        which the data after the bin has not been received), and reset
+        the binner. The remaining data (an incomplete bin) is discarded.
+
+        Returns
+        -------
+        out_ds : xarray.Dataset or None
+          The averages, TKE and spectra of the remaining bins, or None if
+          there are none.
+        """
+
+        if self._buf is None:
+            return None
+        npd0 = self.n_pad // 2
+        npd1 = (self.n_pad + 1) // 2
+        n = (self._buf['time'].size - npd0) // self.n_bin
+        # Zeros after the last bin, as in `reshape`
+        buf = {ky: np.concatenate(
+            [val[..., :npd0 + n * self.n_bin],
+             np.zeros(val.shape[:-1] + (npd1, ), dtype=val.dtype)], axis=-1)
+            for ky, val in self._buf.items()}
+        out = None
+        if n > 0:
+            out = self._calc_bins(buf, n)
+        self.reset()
+        return out
+
+    def _calc_bins(self, buf, n):
+        """Calculate the output for the first `n` bins of `buf`, which
+        starts with the overlap before the first bin."""
+
+        npd0 = self.n_pad // 2
+        n_dat = n * self.n_bin
+        out = xr.Dataset(attrs=self._attrs.copy())
+        time = epoch2dt64(self.mean(buf['time'][npd0:npd0 + n_dat]))
+        for ky, (dims, coords, attrs) in self._vars.items():
+            coords = dict(coords, time=time)
+            out[ky] = xr.DataArray(self.mean(buf[ky][..., npd0:npd0 + n_dat]),
+                                   coords=coords,
+                                   dims=dims,
+                                   attrs=attrs).astype('float32')
+        if 'vel' not in self._vars:
+            return out
+
+        vel = self._astype(buf['vel'])
+        U_mag = np.abs((vel[0] + vel[1] * 1j).astype('complex64')
+                       ).astype('float32')
+        out['U_std'] = xr.DataArray(
+            self.std(U_mag[..., npd0:npd0 + n_dat]).astype('float32'),
+            dims=self._vars['vel'][0][1:],
+            attrs={'units': 'm s-1',
+                   'long_name': 'Water Velocity Standard Deviation'})
+        if vel.ndim != 2 or vel.shape[0] != 3:
+            # TKE and spectra are only calculated for ADV velocity
+            return out
+
+        noise = np.broadcast_to(self.noise, 3)
+        tke = np.nanmean(self.detrend(vel[:, npd0:npd0 + n_dat])**2, axis=-1)
+        tke -= noise[:, None] ** 2
+        out['tke_vec'] = xr.DataArray(
+            tke.astype('float32'),
+            dims=['tke', 'time'],
+            coords={'tke': self.tke, 'time': time},
+            attrs={'units': 'm2 s-2',
+                   'long_name': 'TKE Vector',
+                   'standard_name': 'specific_turbulent_kinetic_energy_of_sea_water'})
+
+        if 'rad' in self.freq_units:
+            fs = 2 * np.pi * self.fs
+            freq_units = 'rad s-1'
+            units = 'm2 s-1 rad-1'
+        else:
+            fs = self.fs
+            freq_units = 'Hz'
+            units = 'm2 s-2 Hz-1'
+        spec = psd(self._padded_bins(vel[:, :n_dat + self.n_pad],
+                                     self.n_pad, self.n_bin),
+                   self.n_fft, fs,
+                   window=self._window(self.window, self.n_fft))
+        for idx in range(3):
+            if np.any(noise[idx]):
+                spec[idx] -= noise[idx]**2 / (fs/2)
+                # Make sure all values of the PSD are >0 (but still small):
+                spec[idx][spec[idx] < 0] = np.min(np.abs(spec[idx])) / 100
+        freq = xr.DataArray(self.calc_freq(units=freq_units),
+                            dims=['freq'],
+                            name='freq',
+                            attrs={'units': freq_units,
+                                   'long_name': 'FFT Frequency Vector',
+                                   'coverage_content_type': 'coordinate'}
+                            ).astype('float32')
+        out['psd'] = xr.DataArray(
+            spec.astype('float32'),
+            coords={'S': self.S, 'time': time, 'freq': freq},
+            dims=['S', 'time', 'freq'],
+            attrs={'units': units,
+                   'n_fft': self.n_fft,
+                   'long_name': 'Power Spectral Density'})
+
+        return out
@@ -43,7 +43,8 @@ config = dict(
                       'netCDF4',
                       'bottleneck'],
     provides=['dolfyn'],
-    scripts=['scripts/motcorrect_vector.py', 'scripts/binary2mat.py'],
+    scripts=['scripts/motcorrect_vector.py', 'scripts/binary2mat.py',
+             'scripts/dolfyn-convert'],
 )
 
 